@@ -0,0 +1,142 @@
+import json
+from collections import deque
+import numpy as np
+from paths import meta_path
+
+def write_meta(filename, meta):
+    """Write the metadata sidecar of a log, replacing any earlier one."""
+    with open(meta_path(filename), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+def read_meta(filename):
+    """Metadata sidecar of a log, or an empty dict if it has none."""
+    try:
+        with open(meta_path(filename)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+class AdaptiveSink:
+    """Sink that keeps only the samples needed to rebuild a signal.
+
+    The collector samples at its full base rate and this sink decides which
+    samples reach the inner sink:
+
+    * level columns (frequencies, utilization) are emitted when a value moves
+      more than `threshold` (relative) and `min_change` (absolute) away from
+      the last emitted value, so holding every emitted value until the next
+      row rebuilds the signal to within the threshold;
+    * counter columns (energy) are emitted when their rate changes by the
+      same amounts against the rate at the last emitted row.  The rate is
+      taken over the trailing `window` seconds, since counters such as RAPL
+      only update every millisecond or so.  Counters are exact at every
+      emitted row, so integrated energy is exact regardless.
+
+    A row is also emitted every `heartbeat` seconds, which must stay below
+    the counter wrap time.  On a change the `pre` most recent unemitted
+    samples and the next `post` samples are emitted too (burst capture), so
+    the row just before a step marks exactly where the old level ended.
+    Every emitted row carries n_samples, the number of base samples it
+    stands for, and the inner sink must record seq.
+    """
+
+    def __init__(self, sink, kinds, threshold=0.01, min_change=0.0, heartbeat=1.0, pre=1, post=0, window=0.05):
+        self.sink = sink
+        self.counter = np.array([kind == 'counter' for kind in kinds])
+        self.threshold = threshold
+        self.min_change = min_change
+        self.heartbeat = heartbeat
+        self.ring = deque(maxlen=pre)
+        self.post = post
+        self.remaining = 0
+        self.k = 0
+        self.last_k = 0
+        self.last_time = None
+        self.last = None
+        self.window = window
+        self.history = deque()
+        self.reference = None
+
+    def _signal(self, timestamp, values):
+        """Levels as they are and counters as rates over the trailing window."""
+        values = np.asarray(values, dtype=np.float64)
+        while len(self.history) > 1 and timestamp - self.history[1][0] >= self.window:
+            self.history.popleft()
+        if not self.history or timestamp - self.history[0][0] < self.window:
+            # No rate until the history covers a whole window
+            signal = np.where(self.counter, np.nan, values)
+        else:
+            prev_time, prev_values = self.history[0]
+            signal = np.where(self.counter, (values - prev_values) / (timestamp - prev_time), values)
+        if self.counter.any():
+            self.history.append((timestamp, values))
+        return signal
+
+    def _changed(self, signal):
+        if self.reference is None:
+            return True
+        limit = np.maximum(self.threshold * np.abs(self.reference), self.min_change)
+        with np.errstate(invalid='ignore'):
+            return bool(np.any(np.abs(signal - self.reference) > limit))
+
+    def _emit(self, k, seq, timestamp, values, signal):
+        self.sink.write(seq, timestamp, list(values) + [k - self.last_k])
+        self.last_k = k
+        self.last_time = timestamp
+        self.reference = signal if self.reference is None else np.where(np.isnan(signal), self.reference, signal)
+
+    def write(self, seq, timestamp, values):
+        self.k += 1
+        sample = self.last = (self.k, seq, timestamp, values, self._signal(timestamp, values))
+        if self.reference is not None:
+            # The first known rate of a counter becomes its reference
+            self.reference = np.where(np.isnan(self.reference), sample[4], self.reference)
+        if self.remaining > 0:
+            self.remaining -= 1
+        elif self._changed(sample[4]):
+            while self.ring:
+                self._emit(*self.ring.popleft())
+            self.remaining = self.post
+        elif timestamp - self.last_time < self.heartbeat:
+            self.ring.append(sample)
+            return
+        self.ring.clear()
+        self._emit(*sample)
+
+    def close(self):
+        # The last sample closes the final segment of every column
+        if self.last is not None and self.last_k != self.k:
+            self._emit(*self.last)
+        self.sink.close()
+
+def add_adaptive_arguments(parser):
+    """Add the adaptive sampling options shared by the loggers to an argparse parser."""
+    parser.add_argument('--adaptive', action='store_true',
+                      help='Only log samples that change by more than --threshold, plus heartbeats '
+                           '(sample at a fast interval and let this drop the flat parts)')
+    parser.add_argument('--threshold', type=float, default=0.01, help='Relative change that is logged')
+    parser.add_argument('--min-change', type=float, default=0.0, help='Absolute change that is logged')
+    parser.add_argument('--heartbeat', type=float, default=1.0, help='Seconds between rows without changes')
+    parser.add_argument('--burst', default='1,0', metavar='PRE,POST',
+                      help='Samples logged at the full rate before and after a change')
+    parser.add_argument('--rate-window', type=float, default=0.05,
+                      help='Seconds over which counter rates are compared')
+
+def adaptive_options(args):
+    """AdaptiveSink options from parsed add_adaptive_arguments() arguments, or None when disabled."""
+    if not args.adaptive:
+        return None
+    pre, post = (int(x) for x in args.burst.split(','))
+    return {'threshold': args.threshold, 'min_change': args.min_change, 'heartbeat': args.heartbeat,
+            'pre': pre, 'post': post, 'window': args.rate_window}
+
+def expand_levels(timestamps, values, query):
+    """Piecewise-constant rebuild of level columns (rows x columns) at the query times.
+
+    Every emitted value holds until the next emitted row; query times before
+    the first row are NaN.
+    """
+    index = np.searchsorted(timestamps, query, side='right') - 1
+    expanded = np.asarray(values, dtype=np.float64)[np.maximum(index, 0)]
+    expanded[index < 0] = np.nan
+    return expanded
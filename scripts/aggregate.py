@@ -0,0 +1,105 @@
+import numpy as np
+
+class BinnedStats:
+    """Streaming per-bin statistics of a quantity across runs.
+
+    Runs are added one at a time and only per-bin accumulators are kept:
+    Welford's running mean and M2 for mean/std/confidence intervals, and a
+    fixed-edge histogram for percentiles.  Memory therefore depends on the
+    number of bins and histogram edges, never on the number of runs.  The
+    arrays grow when a run is longer than any seen before.
+    """
+
+    def __init__(self, bin_width, channels, hist_edges=None):
+        self.bin_width = bin_width
+        self.channels = channels
+        self.hist_edges = np.arange(0, 500.5, 0.5) if hist_edges is None else np.asarray(hist_edges)
+        self.n = np.zeros((0, channels), dtype=np.int64)
+        self.samples = np.zeros((0, channels), dtype=np.int64)
+        self.mean = np.zeros((0, channels))
+        self.m2 = np.zeros((0, channels))
+        self.hist = np.zeros((0, channels, len(self.hist_edges) - 1), dtype=np.int64)
+
+    def _grow(self, bins):
+        extra = bins - len(self.n)
+        if extra <= 0:
+            return
+        self.n = np.concatenate([self.n, np.zeros((extra, self.channels), dtype=np.int64)])
+        self.samples = np.concatenate([self.samples, np.zeros((extra, self.channels), dtype=np.int64)])
+        self.mean = np.concatenate([self.mean, np.zeros((extra, self.channels))])
+        self.m2 = np.concatenate([self.m2, np.zeros((extra, self.channels))])
+        self.hist = np.concatenate([self.hist, np.zeros((extra,) + self.hist.shape[1:], dtype=np.int64)])
+
+    def add_run(self, times, values, method='bin'):
+        """Resample one run onto the grid and fold it into the statistics.
+
+        times are relative to the start of the run (seconds) and values is a
+        samples x channels array; NaN samples are ignored.  With method='bin'
+        the run contributes the mean of its samples in each bin, with
+        method='interp' its value linearly interpolated at each bin centre.
+        """
+        values = np.asarray(values, dtype=np.float64).reshape(len(times), self.channels)
+        bins = int(np.nanmax(times) // self.bin_width) + 1
+        self._grow(bins)
+        if method == 'bin':
+            idx = (times // self.bin_width).astype(np.int64)
+            resampled = np.full((bins, self.channels), np.nan)
+            counts = np.zeros((bins, self.channels), dtype=np.int64)
+            for c in range(self.channels):
+                valid = ~np.isnan(values[:, c])
+                counts[:, c] = np.bincount(idx[valid], minlength=bins)
+                sums = np.bincount(idx[valid], weights=values[valid, c], minlength=bins)
+                np.divide(sums, counts[:, c], out=resampled[:, c], where=counts[:, c] > 0)
+        else:
+            centres = (np.arange(bins) + 0.5) * self.bin_width
+            resampled = np.full((bins, self.channels), np.nan)
+            counts = np.zeros((bins, self.channels), dtype=np.int64)
+            for c in range(self.channels):
+                valid = ~np.isnan(values[:, c])
+                if not valid.any():
+                    continue
+                t, v = times[valid], values[valid, c]
+                inside = (centres >= t[0]) & (centres <= t[-1])
+                resampled[inside, c] = np.interp(centres[inside], t, v)
+                counts[:, c] = np.bincount((t // self.bin_width).astype(np.int64), minlength=bins)[:bins]
+
+        present = ~np.isnan(resampled)
+        x = np.where(present, resampled, 0.0)
+        n = self.n[:bins] + present
+        delta = x - self.mean[:bins]
+        self.mean[:bins] += np.where(present, delta / np.maximum(n, 1), 0.0)
+        self.m2[:bins] += np.where(present, delta * (x - self.mean[:bins]), 0.0)
+        self.n[:bins] = n
+        self.samples[:bins] += counts
+
+        hist_idx = np.clip(np.searchsorted(self.hist_edges, x, side='right') - 1, 0, len(self.hist_edges) - 2)
+        b, c = np.nonzero(present)
+        np.add.at(self.hist, (b, c, hist_idx[b, c]), 1)
+
+    def std(self, ddof=0):
+        """Standard deviation across runs per bin (NaN where fewer than ddof + 1 runs)."""
+        out = np.full(self.m2.shape, np.nan)
+        np.divide(self.m2, self.n - ddof, out=out, where=self.n > ddof)
+        return np.sqrt(out)
+
+    def confidence_interval(self, z=1.96):
+        """Normal-approximation confidence interval of the mean, (low, high)."""
+        half = z * self.std(ddof=1) / np.sqrt(np.maximum(self.n, 1))
+        return self.mean - half, self.mean + half
+
+    def percentile(self, q):
+        """Approximate q-th percentile per bin, interpolated within histogram buckets."""
+        cdf = np.cumsum(self.hist, axis=-1)
+        target = q / 100 * self.n
+        # First bucket whose cumulative count reaches the target rank
+        idx = np.clip((cdf < target[..., None]).sum(axis=-1), 0, self.hist.shape[-1] - 1)
+        below = np.take_along_axis(cdf, idx[..., None], axis=-1)[..., 0] - \
+            np.take_along_axis(self.hist, idx[..., None], axis=-1)[..., 0]
+        inbin = np.take_along_axis(self.hist, idx[..., None], axis=-1)[..., 0]
+        frac = np.divide(target - below, inbin, out=np.zeros(self.n.shape), where=inbin > 0)
+        lo, width = self.hist_edges[idx], np.diff(self.hist_edges)[idx]
+        return np.where(self.n > 0, lo + frac * width, np.nan)
+
+    def times(self):
+        """Start of every bin in seconds since the start of the runs."""
+        return np.arange(len(self.n)) * self.bin_width
@@ -0,0 +1,198 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import subprocess
+import tempfile
+import numpy as np
+import pandas as pd
+from binlog import read_log
+from msr import IA32_APERF, IA32_MPERF, MSR_PLATFORM_INFO, MSR_UNCORE_PERF_STATUS, MSR_UNCORE_RATIO_LIMIT, FakeMsrBackend
+from rapl import POWERCAP_ROOT, RaplSampler, discover_zones, energy_delta
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def make_fake_tree(root, sockets=2, cores_per_socket=2):
+    """Create fake powercap, sysfs CPU and msr trees under root and return their paths."""
+    powercap, sysfs, msr = (os.path.join(root, name) for name in ('powercap', 'cpu', 'msr'))
+    files = {}
+    for socket in range(sockets):
+        for zone, name in ((f'intel-rapl:{socket}', f'package-{socket}'), (f'intel-rapl:{socket}:0', 'dram')):
+            files[os.path.join(powercap, zone, 'name')] = name
+            files[os.path.join(powercap, zone, 'energy_uj')] = '123456789'
+            files[os.path.join(powercap, zone, 'max_energy_range_uj')] = str(2**32)
+    cpus = sockets * cores_per_socket
+    files[os.path.join(sysfs, 'online')] = f'0-{cpus - 1}'
+    backend = FakeMsrBackend(msr)
+    for cpu in range(cpus):
+        files[os.path.join(sysfs, f'cpu{cpu}', 'topology', 'physical_package_id')] = str(cpu // cores_per_socket)
+        files[os.path.join(sysfs, f'cpu{cpu}', 'topology', 'core_id')] = str(cpu % cores_per_socket)
+        files[os.path.join(sysfs, f'cpu{cpu}', 'cpufreq', 'scaling_cur_freq')] = '2000000'
+        # 2.0 GHz base ratio, 1.2-2.4 GHz uncore limits running at 1.8 GHz
+        for reg, value in ((MSR_PLATFORM_INFO, 20 << 8), (IA32_MPERF, 10**9), (IA32_APERF, 10**9),
+                           (MSR_UNCORE_RATIO_LIMIT, (12 << 8) | 24), (MSR_UNCORE_PERF_STATUS, 18)):
+            backend.write(cpu, reg, value)
+    for path, text in files.items():
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(text + '\n')
+    return {'powercap': powercap, 'sysfs': sysfs, 'msr': msr, 'cores': list(range(cpus))}
+
+def logger_commands(tree, interval):
+    """Command line of every logger backend, without the output file and duration."""
+    cores = ','.join(map(str, tree['cores']))
+    msr = ['--msr-root', tree['msr'], '--fake-msr', '--sysfs-root', tree['sysfs']]
+    commands = {
+        'energy_csv': ['energy_logger.py', '-n', '2', '-s', interval, '--no-subzones', '--powercap-root', tree['powercap']],
+        'energy_bin': ['energy_logger.py', '-n', '2', '-s', interval, '--powercap-root', tree['powercap'],
+                       '--format', 'bin'],
+        'energy_subzones': ['energy_logger.py', '-n', '2', '-s', interval, '--subzones',
+                            '--powercap-root', tree['powercap']],
+        'freq_aperf': ['freq_logger.py', '-c', cores, '-i', interval, '-b', 'aperf'] + msr,
+        'freq_scaling': ['freq_logger.py', '-c', cores, '-i', interval, '-b', 'scaling'] + msr,
+        'uncore': ['uncore_freq_logger.py', '-i', interval] + msr,
+        'cpu': ['cpu_logger.py', '-c', '0', '-s', interval],
+        'cpu_breakdown': ['cpu_logger.py', '-c', '0', '-s', interval, '-b'],
+    }
+    if shutil.which('cpupower'):
+        commands['freq_cpupower'] = ['freq_logger.py', '-c', cores, '-i', interval, '-b', 'cpupower'] + msr
+    return commands
+
+def read_timestamps(path):
+    if path.endswith('.bin'):
+        data, _ = read_log(path)
+        return np.asarray(data['timestamp'])
+    return pd.read_csv(path, usecols=['timestamp'])['timestamp'].to_numpy()
+
+def package_energy(sampler, zones, prev):
+    """Joules used by all zones since the counter values prev, and the current values."""
+    cur = sampler.read()
+    joules = sum(energy_delta(p, c, z.max_energy_range_uj) for p, c, z in zip(prev, cur, zones)) / 1e6
+    return joules, cur
+
+def run_logger(command, out, duration, core):
+    """Run one logger pinned to core and return (wall seconds, CPU seconds, exit status)."""
+    argv = [sys.executable, os.path.join(SCRIPTS_DIR, command[0])] + [str(a) for a in command[1:]]
+    argv += ['-f', out, '-d', str(duration)]
+    start = time.monotonic()
+    proc = subprocess.Popen(argv, stdout=subprocess.DEVNULL,
+                            preexec_fn=None if core is None else lambda: os.sched_setaffinity(0, {core}))
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return time.monotonic() - start, usage.ru_utime + usage.ru_stime, proc.returncode
+
+def bench(name, command, interval, duration, core, workdir, rapl=None):
+    """Measure one logger backend: sample rate, jitter, CPU time and, with RAPL, power cost.
+
+    The power cost is the node's mean power while the logger runs minus the
+    mean power of an equally long idle window measured just before it.
+    Interpreter start-up is measured with a zero-length run and taken out of
+    the steady-state CPU share, so short benchmarks stay comparable.
+    """
+    ext = 'bin' if '--format' in command else 'csv'
+    out = os.path.join(workdir, f'{name}.{ext}')
+    result = {'name': name, 'command': ' '.join(map(str, command)), 'interval': interval}
+    if rapl:
+        sampler, zones = rapl
+        _, prev = package_energy(sampler, zones, sampler.read())
+        time.sleep(duration)
+        idle_joules, prev = package_energy(sampler, zones, prev)
+    startup_wall, startup_cpu, _ = run_logger(command, out, 0, core)
+    wall, cpu, status = run_logger(command, out, duration, core)
+    if rapl:
+        joules, _ = package_energy(sampler, zones, prev)
+        result.update(idle_power_w=idle_joules / duration, power_w=joules / wall,
+                      power_cost_w=joules / wall - idle_joules / duration)
+    result.update(exit_status=status, wall_seconds=wall, cpu_seconds=cpu, cpu_percent=100 * cpu / wall,
+                  startup_cpu_seconds=startup_cpu,
+                  steady_cpu_percent=100 * max(cpu - startup_cpu, 0) / max(wall - startup_wall, 1e-9))
+    if status != 0 or not os.path.exists(out):
+        return result
+    timestamps = read_timestamps(out)
+    gaps = np.diff(timestamps)
+    result['samples'] = len(timestamps)
+    if len(gaps):
+        result['rate_hz'] = (len(timestamps) - 1) / (timestamps[-1] - timestamps[0])
+        jitter = np.abs(gaps - interval) * 1e3
+        result['jitter_ms'] = dict(zip(['p50', 'p95', 'p99', 'max'],
+                                       np.percentile(jitter, [50, 95, 99, 100]).tolist()))
+    return result
+
+def regressions(report, baseline, tolerance):
+    """Backends whose CPU use grew or whose rate fell by more than tolerance against a baseline report.
+
+    CPU shares also get 2 percentage points of slack, as rusage is coarse for short runs.
+    """
+    previous = {r['name']: r for r in baseline['results']}
+    found = []
+    for result in report['results']:
+        old = previous.get(result['name'])
+        if old is None or 'rate_hz' not in old:
+            continue
+        if 'rate_hz' not in result:
+            found.append(f"{result['name']}: no samples")
+            continue
+        if result['steady_cpu_percent'] > old['steady_cpu_percent'] * (1 + tolerance) + 2:
+            found.append(f"{result['name']}: CPU {old['steady_cpu_percent']:.1f}% -> {result['steady_cpu_percent']:.1f}%")
+        if result['rate_hz'] < old['rate_hz'] * (1 - tolerance):
+            found.append(f"{result['name']}: rate {old['rate_hz']:.1f} Hz -> {result['rate_hz']:.1f} Hz")
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(prog='bench_loggers',
+                                     description='Measure the overhead of every logger backend against fake sysfs/MSR trees')
+    parser.add_argument('-o', '--output', default='bench_loggers.json', help='JSON report path')
+    parser.add_argument('-d', '--duration', type=float, default=5, help='Seconds each logger runs')
+    parser.add_argument('-i', '--interval', type=float, default=0.01, help='Sampling interval in seconds')
+    parser.add_argument('-b', '--backends', help='Comma-separated backends to run (default: all)')
+    parser.add_argument('-p', '--pin-core', type=int, help='Core to pin the loggers to')
+    parser.add_argument('--power-root', default=POWERCAP_ROOT,
+                      help='Real powercap tree used to measure the power cost (skipped if unreadable)')
+    parser.add_argument('--baseline', help='Earlier report to compare against; exits 1 on a regression')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative change against --baseline')
+    args = parser.parse_args()
+
+    rapl = None
+    try:
+        zones = discover_zones(args.power_root)
+        if not zones:
+            raise FileNotFoundError(args.power_root)
+        rapl = (RaplSampler(zones), zones)
+        rapl[0].read()
+    except OSError:
+        print(f'{args.power_root} not readable, power cost not measured')
+        rapl = None
+
+    with tempfile.TemporaryDirectory() as workdir:
+        tree = make_fake_tree(os.path.join(workdir, 'fake'))
+        commands = logger_commands(tree, args.interval)
+        names = args.backends.split(',') if args.backends else list(commands)
+        results = []
+        for name in names:
+            print(f'Benchmarking {name}...')
+            results.append(bench(name, commands[name], args.interval, args.duration, args.pin_core, workdir, rapl))
+    if rapl:
+        rapl[0].close()
+
+    report = {'host': platform.node(), 'python': platform.python_version(), 'time': time.time(),
+              'duration': args.duration, 'interval': args.interval, 'results': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    for r in results:
+        print(f"{r['name']:>16}: {r.get('rate_hz', 0):8.1f} Hz, jitter p99 "
+              f"{r.get('jitter_ms', {}).get('p99', float('nan')):6.2f} ms, CPU {r['steady_cpu_percent']:5.1f}%"
+              + (f", power +{r['power_cost_w']:.2f} W" if 'power_cost_w' in r else ''))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(report, json.load(f), args.tolerance)
+        for line in found:
+            print(f'Regression: {line}')
+        if found:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+import os
+import csv
+import json
+import struct
+import argparse
+import numpy as np
+
+MAGIC = b'PWRLOG1\n'
+ALIGN = 8
+
+def _record_dtype(columns):
+    return np.dtype([(name, '<' + kind) for name, kind in columns])
+
+def _encode_header(columns, meta):
+    body = json.dumps({'columns': [list(c) for c in columns], 'meta': meta}).encode()
+    # Pad so that the records start on an 8-byte boundary
+    pad = -(len(MAGIC) + 4 + len(body)) % ALIGN
+    body += b' ' * pad
+    return MAGIC + struct.pack('<I', len(body)) + body
+
+def read_header(path):
+    """Return (columns, meta, data_offset) of a binary log."""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{path} is not a binary power log')
+        (length,) = struct.unpack('<I', f.read(4))
+        header = json.loads(f.read(length))
+    columns = [tuple(c) for c in header['columns']]
+    return columns, header['meta'], len(MAGIC) + 4 + length
+
+def recover(path):
+    """Truncate a partially written record at the end of a log; return the record count."""
+    columns, _, offset = read_header(path)
+    itemsize = _record_dtype(columns).itemsize
+    count = (os.path.getsize(path) - offset) // itemsize
+    os.truncate(path, offset + count * itemsize)
+    return count
+
+class BinaryLogWriter:
+    """Append-only writer of fixed-width records.
+
+    Every column is a float64 ('f8') or uint64 ('u8').  Records are packed
+    into a buffer and written out a block at a time, so a crash can leave at
+    most one partial record at the end of the file, which readers ignore and
+    recover() or reopening with append=True cut off.
+    """
+
+    def __init__(self, path, columns, meta=None, block_size=65536, append=False):
+        self.columns = [tuple(c) for c in columns]
+        self.struct = struct.Struct('<' + ''.join('d' if kind == 'f8' else 'Q' for _, kind in self.columns))
+        self.block_size = block_size
+        self.buffer = bytearray()
+        if append and os.path.exists(path):
+            existing, _, _ = read_header(path)
+            if existing != self.columns:
+                raise ValueError(f'{path} has columns {existing}, not {self.columns}')
+            recover(path)
+            self.fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+        else:
+            self.fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            os.write(self.fd, _encode_header(self.columns, meta or {}))
+
+    def write(self, row):
+        self.buffer += self.struct.pack(*row)
+        if len(self.buffer) >= self.block_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            os.write(self.fd, self.buffer)
+            self.buffer = bytearray()
+
+    def close(self):
+        self.flush()
+        os.close(self.fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def read_log(path):
+    """Memory-map a binary log; return (records, meta).
+
+    records is a structured array backed by the file, so records['name']
+    is a zero-copy view of one column.  A partial trailing record is ignored.
+    """
+    columns, meta, offset = read_header(path)
+    dtype = _record_dtype(columns)
+    count = (os.path.getsize(path) - offset) // dtype.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=dtype), meta
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(count,)), meta
+
+def to_csv(path, out):
+    """Export a binary log to CSV with the same column names."""
+    records, _ = read_log(path)
+    with open(out, 'w', newline='') as csvfile:
+        csv_writer = csv.writer(csvfile)
+        csv_writer.writerow(records.dtype.names)
+        csv_writer.writerows(records.tolist())
+
+def main():
+    parser = argparse.ArgumentParser(prog='binlog')
+    sub = parser.add_subparsers(dest='command', required=True)
+    export = sub.add_parser('export', help='Export a binary log to CSV')
+    export.add_argument('log')
+    export.add_argument('csv')
+    repair = sub.add_parser('recover', help='Cut off a partially written trailing record')
+    repair.add_argument('log')
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        to_csv(args.log, args.csv)
+    else:
+        print(f"{args.log}: {recover(args.log)} records")
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,217 @@
-
 import time
 import argparse
 import multiprocessing
 import os
+import sys
+import csv
+import queue
+import json
+import functools
+from sampling import START_SYNC, add_start_argument, report_started, resolve_start, wait_until
+from topology import place, read_topology
+from load_profile import load_profile
+from workloads import KERNELS
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+
+# Seconds past the end of the load allowed for workers to set up, report and exit
+WORKER_GRACE = 30
+
+def process_cpu_time():
+    """CPU time (user + system) of this process in seconds, from /proc/self/stat."""
+    with open('/proc/self/stat') as f:
+        # The command name may contain spaces, so split after its closing parenthesis
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
 
-def busy_loop(duration, core_id=None):
+def duty_cycle(utilization, period, duration, step, gain=0.5):
+    """Hold a fractional utilization by spinning for part of every period and sleeping for the rest.
+
+    utilization is a constant or a function of the seconds since the start,
+    evaluated at every period boundary, so a load profile changes level on
+    the next boundary.  Period boundaries are absolute monotonic deadlines,
+    so they do not drift.  The busy part of each period is corrected by the
+    gap between the target CPU time accumulated so far and the CPU time the
+    kernel accounted to this process, which absorbs scheduling noise and
+    sleep overshoot.  The busy part calls step() repeatedly; returns the
+    total work it reported.
+    """
+    target = utilization if callable(utilization) else (lambda t: utilization)
+    work = 0
+    target_cpu = 0
+    start = time.monotonic()
+    cpu_start = process_cpu_time()
+    end = start + duration
+    period_start = start
+    while period_start < end:
+        level = float(target(period_start - start))
+        error = target_cpu - (process_cpu_time() - cpu_start)
+        busy = min(max(level * period + gain * error, 0), period)
+        target_cpu += level * (min(period_start + period, end) - period_start)
+        busy_until = min(period_start + busy, end)
+        while time.monotonic() < busy_until:
+            work += step()
+        period_start = min(period_start + period, end)
+        wait_until(period_start)
+    return work
+
+def busy_loop(duration, core_id=None, start_at=None, utilization=1.0, period=0.1, kernel='loop', results=None,
+              ready=None, go=None):
+    """Run a workload kernel on one core and put its work counters on results.
+
+    With ready and go, the worker puts its core on ready once it is pinned
+    and its kernel is set up, then waits for go and takes the start time
+    from start_at, a shared multiprocessing.Value, so slow set-up of one
+    worker does not make it start late.
+    """
     if core_id is not None:
         os.sched_setaffinity(0, {core_id})
+    workload = KERNELS[kernel]()
+    if ready is not None:
+        ready.put(core_id)
+        go.wait()
+        start_at = start_at.value
+    if start_at is not None:
+        wait_until(start_at)
+    
+    start_time = time.monotonic()
+    cpu_start = process_cpu_time()
+    work = 0
+    if callable(utilization) or utilization < 1:
+        work = duty_cycle(utilization, period, duration, workload.step)
+    else:
+        while time.monotonic() - start_time < duration:
+            work += workload.step()
+    elapsed = time.monotonic() - start_time
     
-    start_time = time.time()
-    while time.time() - start_time < duration:
-        continue
+    if results is not None:
+        results.put({'core': core_id, 'kernel': kernel, 'unit': workload.unit, 'work': work, 'start': start_time,
+                     'seconds': elapsed, 'cpu_seconds': process_cpu_time() - cpu_start,
+                     'rate': work / elapsed if elapsed > 0 else 0.0})
+
+def collect_results(results, processes, deadline):
+    """One item per worker from a queue, waiting until the monotonic deadline at most.
+
+    Stops as soon as no worker is alive and nothing is left to read, so a
+    worker that died before reporting (e.g. on a bad core or while
+    allocating its buffers) does not block the others.
+    """
+    work = []
+    while len(work) < len(processes):
+        try:
+            work.append(results.get(timeout=min(max(deadline - time.monotonic(), 0.01), 1.0)))
+        except queue.Empty:
+            if time.monotonic() >= deadline or not any(p.is_alive() for p in processes):
+                break
+    return work
+
+def write_profile_log(filename, profile, core_ids, duration, period, start_at=None):
+    """Log a profile's per-core targets on the duty-cycle grid, timestamped like cpu_logger.py rows."""
+    start = start_at if start_at is not None else time.monotonic()
+    wall_start = time.time() - time.monotonic() + start
+    times = [k * period for k in range(int(round(duration / period)) + 1)]
+    with open(filename, 'w', newline='') as csvfile:
+        csv_writer = csv.writer(csvfile)
+        csv_writer.writerow(['timestamp'] + [f'target_core_{core}' for core in core_ids])
+        for t in times:
+            csv_writer.writerow([wall_start + t] + [float(profile.target(core, t)) * 100 for core in core_ids])
 
 def main():
     parser = argparse.ArgumentParser(prog='busy_loop.py')
     parser.add_argument('-d', '--duration', required=True,
                       help='Duration to log in seconds')
-    parser.add_argument('-c', '--cores', required=True,
+    parser.add_argument('-c', '--cores',
                       help='Comma-separated list of core IDs to use')
+    parser.add_argument('-n', '--num-cores', type=int,
+                      help='Number of cores to pick with --placement instead of listing them')
+    parser.add_argument('--placement', choices=['pack', 'spread'], default='pack',
+                      help='How to pick --num-cores cores across sockets and L3 domains (see topology.place)')
+    parser.add_argument('--smt', action='store_true',
+                      help='Let --num-cores use SMT siblings of busy cores')
+    parser.add_argument('--exclude',
+                      help='Comma-separated CPUs whose physical cores stay free, e.g. the logger core')
+    parser.add_argument('--sockets',
+                      help='Comma-separated list of sockets to place cores on (default: all)')
+    parser.add_argument('-u', '--utilization', default='1.0',
+                      help='Target utilization (0.0 to 1.0) for every core, or a comma-separated list per core')
+    parser.add_argument('--profile',
+                      help='Follow a time-varying utilization profile (CSV or JSON, see load_profile.py) instead of -u')
+    parser.add_argument('--profile-log',
+                      help='Write the profile targets, in percent, on the duty-cycle grid to this CSV file')
+    parser.add_argument('-p', '--period', type=float, default=0.1,
+                      help='Duty-cycle period in seconds for fractional utilization')
+    parser.add_argument('-k', '--kernel', choices=sorted(KERNELS), default='loop',
+                      help='Workload run while busy (see workloads.py)')
+    parser.add_argument('-w', '--work-file',
+                      help='Write the work each core completed, and its rate, to this JSON file')
+    add_start_argument(parser)
     
     args = parser.parse_args()
-    duration = int(args.duration)
-    core_ids = [int(core) for core in args.cores.split(',')]
+    duration = float(args.duration)
+    if args.cores:
+        core_ids = [int(core) for core in args.cores.split(',')]
+    elif args.num_cores is not None:
+        sockets = {int(s) for s in args.sockets.split(',')} if args.sockets else None
+        exclude = [int(c) for c in args.exclude.split(',')] if args.exclude else ()
+        core_ids = place(read_topology(), args.num_cores, args.placement, args.smt, sockets, exclude)
+    else:
+        parser.error('either --cores or --num-cores is required')
+    if args.profile:
+        profile = load_profile(args.profile)
+        missing = profile.missing(core_ids)
+        if missing:
+            parser.error(f"--profile has no target for cores {','.join(map(str, missing))} and no 'all' entry")
+        utilizations = [functools.partial(profile.target, core_id) for core_id in core_ids]
+    else:
+        utilizations = [float(u) for u in args.utilization.split(',')]
+        if len(utilizations) == 1:
+            utilizations *= len(core_ids)
+        if len(utilizations) != len(core_ids):
+            parser.error('--utilization needs one value or one value per core')
     
+    results = multiprocessing.Queue()
+    ready = multiprocessing.Queue()
+    go = multiprocessing.Event()
+    start_at = multiprocessing.Value('d', 0.0)
     processes = []
-    for core_id in core_ids:
-        p = multiprocessing.Process(target=busy_loop, args=(duration, core_id))
+    for core_id, utilization in zip(core_ids, utilizations):
+        p = multiprocessing.Process(target=busy_loop,
+                                    args=(duration, core_id, start_at, utilization, args.period,
+                                          args.kernel, results, ready, go))
         processes.append(p)
         p.start()
     
-    # Wait for all processes to complete
+    # Release the workers together once all of them are set up
+    collect_results(ready, processes, time.monotonic() + WORKER_GRACE)
+    start = resolve_start(args.start_at)
+    start = time.monotonic() if start is None else start
+    start_at.value = start
+    go.set()
+    
+    if args.profile and args.profile_log:
+        write_profile_log(args.profile_log, profile, core_ids, duration, args.period, start)
+    
+    # Collect every worker's work counters, then wait for all processes to complete
+    deadline = max(start, time.monotonic()) + duration + WORKER_GRACE
+    work = sorted(collect_results(results, processes, deadline), key=lambda r: r['core'])
+    if args.start_at == START_SYNC and work:
+        # The load runs in full once the last worker has started
+        report_started(max(r['start'] for r in work))
     for p in processes:
-        p.join()
+        p.join(timeout=max(deadline - time.monotonic(), 0))
+        if p.is_alive():
+            p.terminate()
+            p.join()
+    
+    if args.work_file:
+        with open(args.work_file, 'w') as f:
+            json.dump(work, f, indent=2)
+    
+    failed = [core for core, p in zip(core_ids, processes) if p.exitcode != 0]
+    missing = sorted(set(core_ids) - {r['core'] for r in work})
+    if failed or missing:
+        print(f'busy_loop workers failed on cores {failed}, no results from cores {missing}', file=sys.stderr)
+        sys.exit(1)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main() 
@@ -0,0 +1,99 @@
+import os
+import subprocess
+import numpy as np
+from msr import IA32_APERF, IA32_MPERF, MSR_PLATFORM_INFO, MsrReader
+from topology import SYSFS_CPU_ROOT
+
+class AperfMperfFreq:
+    """Effective frequency of a set of cores from APERF/MPERF deltas.
+
+    APERF and MPERF only count while a core is in C0, and MPERF counts at the
+    base (TSC) frequency, so base * dAPERF / dMPERF is the average frequency
+    the core actually ran at while busy since the previous read.  All cores
+    are read in one pass and the ratios are computed as arrays.
+    """
+
+    def __init__(self, cpus, backend=None, base_mhz=None):
+        self.cpus = list(cpus)
+        self.reader = MsrReader(self.cpus, [IA32_APERF, IA32_MPERF], backend)
+        if base_mhz is None:
+            with MsrReader(self.cpus[:1], [MSR_PLATFORM_INFO], backend) as info:
+                base_mhz = ((info.read()[0][0] >> 8) & 0xFF) * 100
+        self.base_mhz = base_mhz
+        self._prev = self._snapshot()
+
+    def _snapshot(self):
+        return np.array(self.reader.read(), dtype=np.uint64)
+
+    def read(self):
+        """Return the frequency of every core in MHz since the previous read.
+
+        Cores that did not leave idle in between report 0.
+        """
+        cur = self._snapshot()
+        # uint64 subtraction wraps around the same way the counters do
+        delta = (cur - self._prev).astype(np.float64)
+        self._prev = cur
+        aperf, mperf = delta[:, 0], delta[:, 1]
+        freq = np.zeros(len(self.cpus))
+        np.divide(aperf * self.base_mhz, mperf, out=freq, where=mperf > 0)
+        return freq
+
+    def close(self):
+        self.reader.close()
+
+class ScalingCurFreq:
+    """Frequency reported by cpufreq's scaling_cur_freq, read through open files."""
+
+    def __init__(self, cpus, root=SYSFS_CPU_ROOT):
+        self.cpus = list(cpus)
+        self._fds = [os.open(os.path.join(root, f'cpu{cpu}', 'cpufreq', 'scaling_cur_freq'), os.O_RDONLY)
+                     for cpu in self.cpus]
+
+    def read(self):
+        """Return the frequency of every core in MHz."""
+        return np.array([int(os.pread(fd, 32, 0)) for fd in self._fds], dtype=np.float64) / 1000
+
+    def close(self):
+        for fd in self._fds:
+            os.close(fd)
+        self._fds = []
+
+def get_core_freq(core):
+    """Read current frequency for a given CPU core using cpupower"""
+    try:
+        cmd = f"cpupower -c {core} frequency-info"
+        result = subprocess.run(cmd.split(), capture_output=True, text=True)
+        
+        # Look for the asserted frequency line
+        for line in result.stdout.split('\n'):
+            if "current CPU frequency" in line and "asserted by call to kernel" in line:
+                # Extract the frequency value and unit
+                parts = line.split(':')[1].strip().split()
+                value = float(parts[0])
+                unit = parts[1].lower()
+                
+                # Convert to MHz if needed
+                if 'ghz' in unit:
+                    value = value * 1000  # Convert GHz to MHz
+                return value
+        
+        return 0  # Return 0 if frequency not found
+    except Exception as e:
+        print(f"Error reading frequency for core {core}: {e}")
+        return 0
+
+class CpupowerFreq:
+    """Frequency as reported by `cpupower frequency-info`, one process per core.
+
+    Far too slow for sampling; kept to validate the other backends against.
+    """
+
+    def __init__(self, cpus):
+        self.cpus = list(cpus)
+
+    def read(self):
+        return np.array([get_core_freq(cpu) for cpu in self.cpus], dtype=np.float64)
+
+    def close(self):
+        pass
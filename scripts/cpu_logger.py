@@ -1,11 +1,8 @@
-import csv
-import time
 import argparse
 import psutil
-
-def get_cpu_utilization(core):
-    """Get CPU utilization for a specific core."""
-    return psutil.cpu_percent(interval=0.1, percpu=True)[core]
+from procstat import PROC_STAT
+from adaptive import adaptive_options
+from telemetry import UtilizationProbe, add_logger_arguments, run_probe
 
 def main():
     parser = argparse.ArgumentParser(
@@ -18,9 +15,14 @@ def main():
                       help='Comma-separated list of core numbers to monitor')
     parser.add_argument('-s', '--sleeptime', default=1,
                       help='Sleep time between measurements in seconds')
+    parser.add_argument('-b', '--breakdown', action='store_true',
+                      help='Also log user/system/irq/idle percentages per core')
+    parser.add_argument('--proc-stat', default=PROC_STAT, help='Path of /proc/stat')
+    parser.add_argument('--format', choices=['csv', 'bin'], default='csv',
+                      help='Output file format (bin: see binlog.py)')
+    add_logger_arguments(parser)
     
     args = parser.parse_args()
-    output_file = args.filename
     cores = [int(core) for core in args.cores.split(',')]
     
     # Validate core numbers
@@ -29,25 +31,11 @@ def main():
         print(f"Error: Core numbers must be between 0 and {num_cores-1}")
         return
 
-    with open(output_file, 'w', newline='') as csvfile:
-        csv_writer = csv.writer(csvfile)
-        # Write header with core numbers
-        header = ['timestamp'] + [f'cpu_core_{core}' for core in cores]
-        csv_writer.writerow(header)
-
-        start_time = time.time()
-        try:
-            while time.time() - start_time < int(args.duration):
-                timestamp = time.time()
-                # Get utilization for each requested core
-                cpu_info = [get_cpu_utilization(core) for core in cores]
-                csv_info = [timestamp] + cpu_info
-                csv_writer.writerow(csv_info)
-                csvfile.flush()
-                # time.sleep(float(args.sleeptime))
-
-        except KeyboardInterrupt:
-            print("Interrupted. Exiting.")
+    # The first sample only takes the baseline snapshot, so every row
+    # covers the sleeptime interval that ends at its timestamp
+    probe = UtilizationProbe(cores, args.breakdown, args.proc_stat)
+    run_probe(probe, float(args.sleeptime), args.filename, float(args.duration), args.format, args.start_at, args.stream,
+              adaptive_options(args))
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main() 
@@ -0,0 +1,176 @@
+"""Energy-efficiency metrics of experiment runs, one row per run and zone.
+
+Energy per work is joules_per_work = energy_j / work.  The energy-delay
+product is taken per unit of work, so it ranks operating points even when
+every run has the same duration:
+
+    edp = joules_per_work * load_seconds / work
+
+that is energy per op times time per op, in joule-seconds per op squared.
+"""
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from paths import util_path, work_path
+from power_analysis import load_phases, parse_run_name, stack_runs
+from run_index import INDEX_PATH, RunIndex, run_logs
+
+def phase_bounds(paths, timestamps):
+    """Per-run (load start, load end, idle windows) from the phase records.
+
+    Runs without a phase record count as all load and no idle.  Idle
+    windows are the warmup and drain phases.
+    """
+    load = np.empty((len(paths), 2))
+    idle = []
+    for i, path in enumerate(paths):
+        phases = load_phases(path)
+        if phases and 'load' in phases:
+            load[i] = phases['load']
+            idle.append([phases[p] for p in ('warmup', 'drain') if p in phases and phases[p][1] > phases[p][0]])
+        else:
+            load[i] = np.nanmin(timestamps[i]), np.nanmax(timestamps[i])
+            idle.append([])
+    return load, idle
+
+def window_mask(timestamps, start, end):
+    """runs x samples mask of the power samples whose interval lies in [start, end] per run."""
+    previous = np.concatenate([np.full((len(timestamps), 1), np.nan), timestamps[:, :-1]], axis=1)
+    return (previous >= start[:, None]) & (timestamps <= end[:, None])
+
+def read_work(path):
+    """Total work and its unit from busy_loop.py's work file, or (nan, None)."""
+    try:
+        with open(work_path(path)) as f:
+            cores = json.load(f)
+    except FileNotFoundError:
+        return np.nan, None
+    return sum(c['work'] for c in cores), cores[0]['unit'] if cores else None
+
+def mean_utilization(path, start, end):
+    """Mean utilization in percent over all logged cores during [start, end], or nan."""
+    try:
+        df = pd.read_csv(util_path(path))
+    except FileNotFoundError:
+        return np.nan
+    cols = [c for c in df.columns if c.startswith('cpu_core_') and c.count('_') == 2]
+    rows = df[(df['timestamp'] > start) & (df['timestamp'] <= end)]
+    return float(rows[cols].to_numpy().mean()) if len(rows) else np.nan
+
+def efficiency_table(paths):
+    """One row per run and zone with energy, idle/active split, energy per work and EDP (see above).
+
+    Energies come from summing the wrap-corrected counter increments, so
+    they are exact up to the counter resolution.  The idle power of a run is
+    its mean power over the warmup and drain phases; idle energy is that
+    power over the load phase and active energy is the remainder.  An 'all'
+    zone sums the top-level zones (sockets).
+    """
+    timestamps, power, zones, _ = stack_runs(paths)
+    dt = np.diff(timestamps, axis=1, prepend=np.nan)
+    energy = power * dt[..., None]
+
+    top = [i for i, z in enumerate(zones) if z.count('_') == 2]
+    energy = np.concatenate([energy, energy[..., top].sum(axis=-1, keepdims=True)], axis=-1)
+    zone_names = [z[len('energy_zone_'):] for z in zones] + ['all']
+
+    load, idle = phase_bounds(paths, timestamps)
+    in_load = window_mask(timestamps, load[:, 0], load[:, 1])
+    load_seconds = np.where(in_load, dt, 0).sum(axis=1)
+    load_energy = np.where(in_load[..., None], energy, 0).sum(axis=1)
+
+    in_idle = np.zeros_like(in_load)
+    for i, windows in enumerate(idle):
+        for start, end in windows:
+            in_idle[i] |= window_mask(timestamps[i:i + 1], np.array([start]), np.array([end]))[0]
+    idle_seconds = np.where(in_idle, dt, 0).sum(axis=1)
+    idle_power = np.full(load_energy.shape, np.nan)
+    np.divide(np.where(in_idle[..., None], energy, 0).sum(axis=1), idle_seconds[:, None],
+              out=idle_power, where=idle_seconds[:, None] > 0)
+    idle_energy = idle_power * load_seconds[:, None]
+
+    work = np.empty(len(paths))
+    units = []
+    for i, path in enumerate(paths):
+        work[i], unit = read_work(path)
+        units.append(unit)
+
+    rows = []
+    for i, path in enumerate(paths):
+        params = parse_run_name(path)
+        util = mean_utilization(path, *load[i])
+        for z, zone in enumerate(zone_names):
+            rows.append(dict(params, zone=zone,
+                             load_seconds=load_seconds[i], energy_j=load_energy[i, z],
+                             mean_power_w=load_energy[i, z] / load_seconds[i],
+                             idle_power_w=idle_power[i, z], idle_energy_j=idle_energy[i, z],
+                             active_energy_j=load_energy[i, z] - idle_energy[i, z],
+                             work=work[i], work_unit=units[i], mean_utilization=util))
+    table = pd.DataFrame(rows)
+    table['joules_per_work'] = table['energy_j'] / table['work']
+    table['active_joules_per_work'] = table['active_energy_j'] / table['work']
+    table['edp'] = table['joules_per_work'] * table['load_seconds'] / table['work']
+    return table
+
+def summarize(table):
+    """Mean and standard deviation of every metric per setting and zone, across runs."""
+    keys = ['passive_socket', 'freq', 'utilization', 'zone']
+    metrics = table.drop(columns=['run', 'work_unit']).groupby(keys)
+    summary = metrics.agg(['mean', 'std'])
+    summary.columns = [f'{metric}_{stat}' for metric, stat in summary.columns]
+    summary['runs'] = table.groupby(keys).size()
+    return summary.reset_index()
+
+def write_table(table, path):
+    """Write a table as Parquet or CSV depending on the file extension."""
+    if path.endswith('.parquet'):
+        table.to_parquet(path, index=False)
+    else:
+        table.to_csv(path, index=False)
+
+def read_table(path):
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+def main():
+    parser = argparse.ArgumentParser(prog='efficiency')
+    parser.add_argument('-o', '--output', default='../data/efficiency.csv',
+                      help='Output table (.csv or .parquet)')
+    parser.add_argument('--pattern',
+                      help='Glob of the energy logs to include (default: every run in the run index)')
+    parser.add_argument('--index', default=INDEX_PATH, help='Run index database (see run_index.py)')
+    parser.add_argument('--per-run', action='store_true',
+                      help='Write one row per run and zone instead of the per-setting summary')
+    parser.add_argument('--incremental', action='store_true',
+                      help='With --per-run, only add the runs indexed since the last incremental update to --output')
+    args = parser.parse_args()
+
+    if args.incremental and (not args.per_run or args.pattern):
+        parser.error('--incremental needs --per-run and the run index')
+    with RunIndex(args.index) as index:
+        if args.pattern:
+            paths = run_logs(args.pattern)
+        else:
+            index.scan()
+            runs = index.new_runs('efficiency') if args.incremental else index.query()
+            paths = [run['path'] for run in runs]
+        if not paths:
+            if args.incremental:
+                print('No new runs')
+                return
+            parser.error('no energy logs to process')
+        table = efficiency_table(paths)
+        if args.incremental and os.path.exists(args.output):
+            # Rows of re-recorded runs are replaced by the new ones
+            previous = read_table(args.output)
+            table = pd.concat([previous, table]).drop_duplicates(
+                ['passive_socket', 'freq', 'utilization', 'run', 'zone'], keep='last')
+        write_table(table if args.per_run else summarize(table), args.output)
+        if args.incremental:
+            index.mark_processed('efficiency', runs)
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,7 @@
-import csv
-import time
 import argparse
-import subprocess
-
-def run_powercap_info(zone):
-    command = f"sudo powercap-info -p intel-rapl -z {zone} -j" 
-    result = subprocess.check_output(command, shell=True)
-    return result.decode().strip()
+from rapl import POWERCAP_ROOT
+from adaptive import adaptive_options
+from telemetry import EnergyProbe, add_logger_arguments, run_probe
 
 def main():
     parser = argparse.ArgumentParser(
@@ -14,30 +9,20 @@ def main():
     parser.add_argument('-f','--filename')    
     parser.add_argument('-d','--duration') 
     parser.add_argument('-n','--numsockets') 
-    # parser.add_argument('-s','--sleeptime')           
+    parser.add_argument('-s','--sleeptime', type=float, default=0.01,
+                      help='Sampling interval in seconds (0 samples as fast as possible)')
+    parser.add_argument('--subzones', action=argparse.BooleanOptionalAction, default=False,
+                      help='Also log RAPL subzones (core, uncore, dram); by default only packages are logged')
+    parser.add_argument('--powercap-root', default=POWERCAP_ROOT,
+                      help='Root of the powercap sysfs tree')
+    parser.add_argument('--format', choices=['csv', 'bin'], default='csv',
+                      help='Output file format (bin: see binlog.py)')
+    add_logger_arguments(parser)
     args = parser.parse_args()
-    output_file = args.filename
-
-    with open(output_file, 'w', newline='') as csvfile:
-        csv_writer = csv.writer(csvfile)
-        csv_writer.writerow(['timestamp', 'energy_zone_0', 'energy_zone_1'])
-
-        start_time = time.time()
-        try:
-            while time.time() - start_time < int(args.duration):
-                timestamp = time.time()
-                power_info = [ run_powercap_info(x) for x in range(int(args.numsockets))]
-                # power_info_0 = run_powercap_info(0)
-                # power_info_1 = run_powercap_info(1)
-                csv_info = [timestamp]
-                csv_info.extend(power_info)
-                csv_writer.writerow(csv_info)
-                # csvfile.flush()
-                # time.sleep(1)
 
-            csvfile.flush()
-        except KeyboardInterrupt:
-            print("Interrupted. Exiting.")
+    probe = EnergyProbe(int(args.numsockets), args.subzones, args.powercap_root)
+    run_probe(probe, args.sleeptime, args.filename, float(args.duration), args.format, args.start_at, args.stream,
+              adaptive_options(args))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
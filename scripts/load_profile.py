@@ -0,0 +1,117 @@
+import csv
+import json
+import argparse
+import numpy as np
+
+class Profile:
+    """Target utilization over time, for all cores or per core.
+
+    targets maps a core id, or None for every core without its own entry,
+    to a (times, values) pair: times in seconds from the start of the load,
+    values between 0 and 1.  Between points the target either holds the
+    previous value ('step') or is interpolated ('linear'); before the first
+    and after the last point it holds the nearest value.
+    """
+
+    def __init__(self, targets, interpolation='step'):
+        self.targets = {core: (np.asarray(t, dtype=np.float64), np.asarray(v, dtype=np.float64))
+                        for core, (t, v) in targets.items()}
+        self.interpolation = interpolation
+
+    def target(self, core, t):
+        """Target utilization of a core at time t (a float or an array of times)."""
+        times, values = self.targets[core] if core in self.targets else self.targets[None]
+        if self.interpolation == 'linear':
+            return np.interp(t, times, values)
+        idx = np.clip(np.searchsorted(times, t, side='right') - 1, 0, len(times) - 1)
+        return values[idx]
+
+    def missing(self, cores):
+        """Cores the profile has no target for, neither their own nor an 'all' one."""
+        return [] if None in self.targets else [core for core in cores if core not in self.targets]
+
+    def end(self):
+        """Time of the last point of any core."""
+        return max(times[-1] for times, _ in self.targets.values())
+
+def load_profile(path):
+    """Read a profile from CSV or JSON.
+
+    CSV: a 'time' column and either an 'all' column or 'core_<id>' columns,
+    with step interpolation.  JSON: {"interpolation": "step" | "linear",
+    "all": [[time, target], ...], "cores": {"<id>": [[time, target], ...]}}.
+    """
+    if path.endswith('.json'):
+        with open(path) as f:
+            spec = json.load(f)
+        targets = {}
+        if 'all' in spec:
+            targets[None] = tuple(zip(*spec['all']))
+        for core, points in spec.get('cores', {}).items():
+            targets[int(core)] = tuple(zip(*points))
+        return Profile(targets, spec.get('interpolation', 'step'))
+    with open(path) as f:
+        rows = list(csv.DictReader(f))
+    times = [float(r['time']) for r in rows]
+    targets = {}
+    for col in rows[0]:
+        if col == 'all':
+            targets[None] = (times, [float(r[col]) for r in rows])
+        elif col.startswith('core_'):
+            targets[int(col[len('core_'):])] = (times, [float(r[col]) for r in rows])
+    return Profile(targets)
+
+def save_profile(profile, path, step=None):
+    """Write a profile as CSV; linear profiles are sampled every `step` seconds."""
+    cores = sorted(profile.targets, key=lambda c: -1 if c is None else c)
+    if profile.interpolation == 'linear':
+        times = np.arange(0, profile.end() + step / 2, step)
+    else:
+        times = np.unique(np.concatenate([t for t, _ in profile.targets.values()]))
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['time'] + ['all' if c is None else f'core_{c}' for c in cores])
+        for t in times:
+            writer.writerow([t] + [float(profile.target(c, t)) for c in cores])
+
+def step_profile(levels, dwell):
+    """Hold each level for `dwell` seconds in turn."""
+    return Profile({None: (np.arange(len(levels)) * dwell, levels)})
+
+def ramp_profile(start, end, duration):
+    """Move linearly from `start` to `end` over `duration` seconds."""
+    return Profile({None: ([0, duration], [start, end])}, 'linear')
+
+def square_profile(low, high, period, duration):
+    """Alternate between `low` and `high` every half period."""
+    times = np.arange(0, duration, period / 2)
+    return Profile({None: (times, np.where(np.arange(len(times)) % 2 == 0, low, high))})
+
+def main():
+    parser = argparse.ArgumentParser(prog='load_profile')
+    parser.add_argument('-o', '--output', required=True, help='Output profile CSV file path')
+    sub = parser.add_subparsers(dest='shape', required=True)
+    step = sub.add_parser('step', help='Hold a sequence of levels')
+    step.add_argument('--levels', required=True, help='Comma-separated utilization levels')
+    step.add_argument('--dwell', type=float, required=True, help='Seconds per level')
+    ramp = sub.add_parser('ramp', help='Linear ramp between two levels')
+    ramp.add_argument('--start', type=float, required=True)
+    ramp.add_argument('--end', type=float, required=True)
+    ramp.add_argument('--duration', type=float, required=True)
+    ramp.add_argument('--resolution', type=float, default=0.1, help='Seconds between written points')
+    square = sub.add_parser('square', help='Square wave between two levels')
+    square.add_argument('--low', type=float, required=True)
+    square.add_argument('--high', type=float, required=True)
+    square.add_argument('--period', type=float, required=True)
+    square.add_argument('--duration', type=float, required=True)
+    args = parser.parse_args()
+
+    if args.shape == 'step':
+        save_profile(step_profile([float(x) for x in args.levels.split(',')], args.dwell), args.output)
+    elif args.shape == 'ramp':
+        save_profile(ramp_profile(args.start, args.end, args.duration), args.output, args.resolution)
+    else:
+        save_profile(square_profile(args.low, args.high, args.period, args.duration), args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import os
+import struct
+
+IA32_MPERF = 0xE7
+IA32_APERF = 0xE8
+MSR_PLATFORM_INFO = 0xCE
+MSR_UNCORE_RATIO_LIMIT = 0x620
+MSR_UNCORE_PERF_STATUS = 0x621
+
+MSR_DEV_ROOT = '/dev/cpu'
+
+class MsrBackend:
+    """Opens the msr device of each CPU, /dev/cpu/N/msr (requires root and the msr module)."""
+
+    def __init__(self, root=MSR_DEV_ROOT):
+        self.root = root
+
+    def path(self, cpu):
+        return os.path.join(self.root, str(cpu), 'msr')
+
+    def open(self, cpu):
+        return os.open(self.path(cpu), os.O_RDONLY)
+
+    def offset(self, reg):
+        """File offset at which register reg is read."""
+        return reg
+
+class FakeMsrBackend(MsrBackend):
+    """File-based stand-in for /dev/cpu, for tests and benchmarks.
+
+    Each CPU is a sparse regular file holding every register as an 8-byte
+    little-endian value at offset 8 * reg.  The real device is addressed by
+    register number, but neighbouring registers would overlap in a plain file.
+    """
+
+    def offset(self, reg):
+        return 8 * reg
+
+    def write(self, cpu, reg, value):
+        os.makedirs(os.path.dirname(self.path(cpu)), exist_ok=True)
+        fd = os.open(self.path(cpu), os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            os.pwrite(fd, struct.pack('<Q', value), self.offset(reg))
+        finally:
+            os.close(fd)
+
+class MsrReader:
+    """Reads a fixed set of MSRs on a fixed set of CPUs with one pread() each.
+
+    The msr device files are opened once, so a read costs len(cpus) *
+    len(regs) syscalls and no process spawns.
+    """
+
+    def __init__(self, cpus, regs, backend=None):
+        self.cpus = list(cpus)
+        self.regs = list(regs)
+        self.backend = backend or MsrBackend()
+        self._offsets = [self.backend.offset(reg) for reg in self.regs]
+        self._fds = []
+        try:
+            for cpu in self.cpus:
+                self._fds.append(self.backend.open(cpu))
+        except OSError:
+            self.close()
+            raise
+
+    def read(self):
+        """Return one list of register values per CPU, in the order given."""
+        return [[struct.unpack('<Q', os.pread(fd, 8, off))[0] for off in self._offsets]
+                for fd in self._fds]
+
+    def close(self):
+        for fd in self._fds:
+            os.close(fd)
+        self._fds = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def uncore_ratio_limits(value):
+    """Decode MSR_UNCORE_RATIO_LIMIT into (min_mhz, max_mhz)."""
+    return ((value >> 8) & 0x7F) * 100, (value & 0x7F) * 100
+
+def uncore_current_freq(value):
+    """Decode MSR_UNCORE_PERF_STATUS into the current uncore frequency in MHz."""
+    return (value & 0x7F) * 100
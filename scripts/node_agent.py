@@ -0,0 +1,157 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import subprocess
+from sampling import START_SYNC
+
+def phase_plan(spec):
+    """Offsets in seconds from the shared start of the warmup, load and drain phases."""
+    warmup = spec.get('warmup', 0)
+    load = spec['duration']
+    drain = spec.get('drain', 0)
+    return [('warmup', 0, warmup), ('load', warmup, warmup + load), ('drain', warmup + load, warmup + load + drain)]
+
+# Seconds a process may start after its planned start before it is flagged as late
+LATE_TOLERANCE = 0.01
+
+class Child:
+    """One process of an experiment and what it reported through the start handshake."""
+
+    def __init__(self, kind, script, cmd, core, offset):
+        preexec = (lambda: os.sched_setaffinity(0, {core})) if core is not None else None
+        self.kind = kind
+        self.script = script
+        self.offset = offset
+        self.proc = subprocess.Popen(cmd + ['--start-at', START_SYNC], preexec_fn=preexec, text=True,
+                                     stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.ready = threading.Event()
+        self.is_ready = False
+        self.started = None
+        self.reader = threading.Thread(target=self._read, daemon=True)
+        self.reader.start()
+
+    def _read(self):
+        # Handshake lines are consumed, anything else the process prints is passed on
+        for line in self.proc.stdout:
+            if line.strip() == 'ready':
+                self.is_ready = True
+                self.ready.set()
+            elif line.startswith('started '):
+                self.started = float(line.split()[1])
+            else:
+                sys.stderr.write(line)
+        self.ready.set()
+
+    def release(self, start_at):
+        try:
+            self.proc.stdin.write(f'{start_at + self.offset!r}\n')
+            self.proc.stdin.close()
+        except BrokenPipeError:
+            pass
+
+def measured_phases(plan, start_at, children, duration):
+    """Phase boundaries from the start times the processes reported, as time.monotonic() values.
+
+    The warmup starts once every logger runs, the load phase covers the
+    time every load runs and the drain ends when the first logger stops.
+    Boundaries no process reported fall back to the plan.
+    """
+    def starts(kind):
+        times = [c.started for c in children if c.kind == kind]
+        return times if times and None not in times else None
+    total = plan[-1][2]
+    loggers, loads = starts('logger'), starts('load')
+    warmup_start = max(loggers) if loggers else start_at
+    load_start = max(loads) if loads else start_at + plan[1][1]
+    load_end = min(loads) + duration if loads else start_at + plan[1][2]
+    drain_end = min(loggers) + total if loggers else start_at + total
+    return [('warmup', warmup_start, load_start), ('load', load_start, load_end), ('drain', load_end, drain_end)]
+
+def run_spec(spec):
+    """Run one experiment on this node from a spec; return the phase record.
+
+    Files listed in the spec's `files` ({name: content}) are written first.
+    All processes are spawned up front with --start-at sync: each reports
+    `ready` once it has set up (imports, pinning, buffers), and only when all
+    of them are ready, or `ready_timeout` seconds have passed, does the agent
+    send every process its start time, `start_delay` seconds from then.
+    Loggers run through the warmup, load and drain phases; load generators
+    only run during the load phase.  Every process reports the time it
+    actually started.  The returned record has the wall-clock and monotonic
+    time of every phase boundary as measured from those start times, the
+    planned boundaries, and per process its exit status, planned and actual
+    start and how late it started.
+    """
+    for name, content in spec.get('files', {}).items():
+        with open(name, 'w') as f:
+            f.write(content)
+    plan = phase_plan(spec)
+    total = plan[-1][2]
+    # Offset between the wall clock the loggers write and the monotonic clock
+    wall_offset = time.time() - time.monotonic()
+
+    spawned = time.monotonic()
+    children = []
+    for kind, entries, begin, length in (('logger', spec.get('loggers', []), 0, total),
+                                         ('load', spec.get('loads', []), plan[1][1], spec['duration'])):
+        for entry in entries:
+            cmd = [sys.executable, entry['script'], *map(str, entry.get('args', [])), '-d', f'{length:g}']
+            children.append(Child(kind, entry['script'], cmd, entry.get('core'), begin))
+
+    deadline = spawned + spec.get('ready_timeout', 60)
+    for child in children:
+        child.ready.wait(max(deadline - time.monotonic(), 0))
+    ready_at = time.monotonic()
+    start_at = ready_at + spec.get('start_delay', 0.2)
+    for child in children:
+        child.release(start_at)
+
+    record = {
+        'spawned': wall_offset + spawned,
+        'ready': wall_offset + ready_at,
+        'start_monotonic': start_at,
+        'planned': [{'name': name, 'start': wall_offset + start_at + begin, 'end': wall_offset + start_at + end}
+                    for name, begin, end in plan],
+        'processes': [],
+    }
+    for child in children:
+        status = child.proc.wait()
+        child.reader.join()
+        planned = start_at + child.offset
+        late = None if child.started is None else child.started - planned
+        record['processes'].append({'kind': child.kind, 'script': child.script, 'pid': child.proc.pid,
+                                    'exit_status': status, 'reaped': time.time(), 'ready': child.is_ready,
+                                    'planned_start': planned, 'started': child.started, 'late': late})
+        if late is None or late > LATE_TOLERANCE:
+            print(f"{child.script} ({child.kind}) " + ("did not report its start" if late is None
+                                                       else f"started {late:.3f} s late"), file=sys.stderr)
+    record['phases'] = [{'name': name, 'start': wall_offset + begin, 'end': wall_offset + end,
+                         'start_monotonic': begin, 'end_monotonic': end}
+                        for name, begin, end in measured_phases(plan, start_at, children, spec['duration'])]
+    return record
+
+def main():
+    parser = argparse.ArgumentParser(prog='node_agent')
+    parser.add_argument('--spec', required=True, help='Experiment spec as JSON, or @path to a JSON file')
+    parser.add_argument('-o', '--phases', help='Where to write the phase record (JSON)')
+    args = parser.parse_args()
+
+    if args.spec.startswith('@'):
+        with open(args.spec[1:]) as f:
+            spec = json.load(f)
+    else:
+        spec = json.loads(args.spec)
+
+    record = run_spec(spec)
+    if args.phases:
+        with open(args.phases, 'w') as f:
+            json.dump(record, f, indent=2)
+    print(json.dumps(record))
+    if any(p['exit_status'] != 0 for p in record['processes']):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import os
+
+def util_label(utilization):
+    """Utilization as written in run names: the shortest exact decimal, e.g. 0.25 or 1.0."""
+    return repr(float(utilization))
+
+def side_path(path, kind, ext):
+    """Path of a file recorded alongside an energy log, e.g. energy_<id>.<kind>.<ext>."""
+    return f'{os.path.splitext(path)[0]}.{kind}.{ext}'
+
+def meta_path(path):
+    """Path of the metadata sidecar of a log, energy_<id>.meta.json, see adaptive.write_meta()."""
+    return side_path(path, 'meta', 'json')
+
+def phases_path(path):
+    """Path of the phase record node_agent.py writes for an energy log."""
+    return side_path(path, 'phases', 'json')
+
+def work_path(path):
+    """Path of the work counters busy_loop.py writes for an energy log."""
+    return side_path(path, 'work', 'json')
+
+def target_path(path):
+    """Path of the load profile targets busy_loop.py logs for an energy log."""
+    return side_path(path, 'target', 'csv')
+
+def util_path(path):
+    """Path of the cpu_logger.py utilization trace recorded with an energy log."""
+    return side_path(path, 'util', 'csv')
+
+def freq_path(path):
+    """Path of the freq_logger.py core frequency trace recorded with an energy log."""
+    return side_path(path, 'freq', 'csv')
+
+def uncore_path(path):
+    """Path of the uncore_freq_logger.py trace recorded with an energy log."""
+    return side_path(path, 'uncore', 'csv')
+
+def side_paths(path):
+    """Every file that may be recorded alongside an energy log."""
+    return [meta_path(path), phases_path(path), work_path(path), target_path(path), util_path(path),
+            freq_path(path), uncore_path(path)]
@@ -1,19 +1,25 @@
 import pandas as pd
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import os
-import glob
+import json
+import pickle
+import hashlib
+import argparse
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from latexify import *
+from aggregate import BinnedStats
+from paths import util_label
+from power_analysis import LEGACY_ENERGY_RANGE, align_zones, load_phases, load_run, log_zones, zone_ranges, zone_union
+from run_index import ENERGY_DIR, INDEX_PATH, RunIndex
 
-def handle_energy_counter_overflow(series, max_value=2**32):
-    """Handle counter overflow by detecting large negative differences"""
+def handle_energy_counter_overflow(series, max_value=LEGACY_ENERGY_RANGE):
+    """Handle counter overflow: counters only decrease when they wrap at max_value"""
     diff = series.diff()
-    # Detect where overflow might have occurred (large negative values)
-    overflow_idx = diff < -max_value/2
-    # Calculate the actual difference accounting for overflow
-    corrected_diff = diff.copy()
-    corrected_diff[overflow_idx] += max_value
-    return corrected_diff
+    # Every negative difference is a wraparound of the counter
+    return diff % max_value
 
 def calculate_power(csv_file):
     """Calculate power consumption from energy measurements"""
@@ -26,13 +32,14 @@ def calculate_power(csv_file):
     # Calculate time differences
     time_diff = df['timestamp'].diff()
     
-    # Handle energy counter overflows for each zone
+    # Handle energy counter overflows for each zone, at the ranges recorded with the log
     energy_cols = [col for col in df.columns if col.startswith('energy_zone_')]
+    ranges = zone_ranges(csv_file, energy_cols)
     powers = {}
     
-    for zone in energy_cols:
+    for zone, max_value in zip(energy_cols, ranges):
         # Calculate energy differences handling overflow
-        energy_diff = handle_energy_counter_overflow(df[zone])
+        energy_diff = handle_energy_counter_overflow(df[zone], max_value)
         
         # Calculate power (energy/time) in Watts
         # Convert from microjoules to joules (divide by 1e6)
@@ -45,75 +52,219 @@ def calculate_power(csv_file):
     
     return df
 
-def combine_power_runs(run_files):
-    """Combine power measurements from multiple runs"""
-    # Read and calculate power for each run
-    power_dfs = [calculate_power(f) for f in run_files]
+def combine_power_runs(run_files, bin_width=None, method='bin', phase='load'):
+    """Combine power measurements from multiple runs on a common time grid
+
+    Runs with a phase record are trimmed to `phase` and timed from its start;
+    other runs are timed from their first sample.  Zones are those of all
+    runs together; runs that did not log a zone do not count towards it.
+    """
+    zones = zone_union(log_zones(f) for f in run_files)
+    stats = None
+    for f in run_files:
+        # Load one run at a time; only the per-bin accumulators are kept
+        timestamps, power, run_zones = load_run(f)
+        power = align_zones(power, run_zones, zones)
+        phases = load_phases(f)
+        if phases and phase in phases:
+            start, end = phases[phase]
+            # Keep samples whose whole measurement interval lies in the phase
+            previous = np.concatenate([[np.nan], timestamps[:-1]])
+            keep = (previous >= start) & (timestamps <= end)
+            times, power = timestamps[keep] - start, power[keep]
+        else:
+            times = timestamps - timestamps[0]
+        if stats is None:
+            if bin_width is None:
+                # Default to the sampling interval of the first run
+                bin_width = float(np.median(np.diff(timestamps)))
+            stats = BinnedStats(bin_width, len(zones))
+        stats.add_run(times, power, method)
     
-    # Find minimum length among all runs
-    min_length = min(len(df) for df in power_dfs)
+    # Calculate statistics across runs for each time bin and zone
+    present = stats.n > 0
+    mean = np.where(present, stats.mean, np.nan)
+    std = stats.std()
+    ci_low, ci_high = stats.confidence_interval()
     
-    # Create arrays for each socket's power values
-    socket0_power = np.array([df['power_zone_0'].iloc[:min_length].values for df in power_dfs])
-    socket1_power = np.array([df['power_zone_1'].iloc[:min_length].values for df in power_dfs])
+    # Create a new dataframe with the combined results
+    combined = {'timestamp': stats.times()}
+    for i, zone in enumerate(zones):
+        name = f'power_{zone[7:]}'
+        combined[f'{name}_mean'] = mean[:, i]
+        combined[f'{name}_std'] = std[:, i]
+        combined[f'{name}_ci_low'] = ci_low[:, i]
+        combined[f'{name}_ci_high'] = ci_high[:, i]
+        for q in (5, 50, 95):
+            combined[f'{name}_p{q}'] = stats.percentile(q)[:, i]
+        combined[f'{name}_runs'] = stats.n[:, i]
+        combined[f'{name}_samples'] = stats.samples[:, i]
     
-    # Calculate mean and std across runs for each time point
-    socket0_mean = np.mean(socket0_power, axis=0)
-    socket0_std = np.std(socket0_power, axis=0)
-    socket1_mean = np.mean(socket1_power, axis=0)
-    socket1_std = np.std(socket1_power, axis=0)
+    return pd.DataFrame(combined)
+
+def decimate(values, max_points):
+    """Indices of a min/max decimation of values to about max_points points.
+
+    The samples are split into max_points / 2 buckets and the smallest and
+    largest value of each bucket are kept in time order, so peaks survive
+    while the drawn points stay near the screen resolution.
+    """
+    n = len(values)
+    if n <= max_points:
+        return np.arange(n)
+    buckets = max(max_points // 2, 1)
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = values
+    padded = padded.reshape(buckets, size)
+    valid = ~np.isnan(padded).all(axis=1)
+    filled_low = np.where(np.isnan(padded), np.inf, padded)
+    filled_high = np.where(np.isnan(padded), -np.inf, padded)
+    offsets = np.arange(buckets)[valid] * size
+    low = offsets + filled_low[valid].argmin(axis=1)
+    high = offsets + filled_high[valid].argmax(axis=1)
+    return np.unique(np.concatenate([low, high]))
+
+def figure_data(active_socket, util, freqs, zones, combined_runs, ylim, max_points):
+    """Everything needed to draw one side-by-side figure, decimated per zone."""
+    passive_socket = 1 - active_socket
+    series = []
+    for freq in freqs:
+        combined_df = combined_runs(passive_socket, freq, util)
+        if combined_df is None:
+            continue
+        time = (combined_df['timestamp'] - combined_df['timestamp'].iloc[0]).to_numpy()
+        lines = {}
+        for zone in zones:
+            if f'power_zone_{zone}_mean' not in combined_df:
+                continue
+            mean = combined_df[f'power_zone_{zone}_mean'].to_numpy()
+            std = combined_df[f'power_zone_{zone}_std'].to_numpy()
+            keep = decimate(mean, max_points)
+            lines[zone] = (time[keep], mean[keep], std[keep])
+        series.append((f'Frequency of socket {passive_socket} = {freq}', lines))
+    return {
+        'name': f'power_side_by_side_active{active_socket}_util_{util_label(util)}',
+        'title': f'Power Consumption | Active Socket: {active_socket} | Active Socket Freq = 1.2GHz | Active Socket Utilization = {util*100}%',
+        'zones': zones,
+        'series': series,
+        'ylim': ylim,
+    }
+
+def figure_digest(figure):
+    return hashlib.sha1(pickle.dumps(figure, protocol=4)).hexdigest()
+
+def render_figure(figure, folder='../data/plots/'):
+    """Draw and save one figure from figure_data(); runs in a worker process."""
+    zones = figure['zones']
+    fig, axes = plt.subplots(1, len(zones), figsize=(10 * len(zones), 6), squeeze=False)
+    axes = dict(zip(zones, axes[0]))
     
-    # Create a new dataframe with the combined results
-    combined_df = pd.DataFrame({
-        'timestamp': power_dfs[0]['timestamp'].iloc[:min_length],
-        'power_zone_0_mean': socket0_mean,
-        'power_zone_0_std': socket0_std,
-        'power_zone_1_mean': socket1_mean,
-        'power_zone_1_std': socket1_std
-    })
-    
-    return combined_df
+    # Plot each frequency's power with error bars
+    for label, lines in figure['series']:
+        for zone, ax in axes.items():
+            if zone not in lines:
+                continue
+            time, mean, std = lines[zone]
+            ax.errorbar(time, mean, yerr=std, label=label)
+    
+    # Set titles and labels for each zone's plot
+    for zone, ax in axes.items():
+        ax.set_xlabel('Time (s)')
+        ax.set_ylabel('Power Consumption (W)')
+        ax.set_title(f'Socket {zone.replace("_", " subzone ")} Power Consumption\n')
+        ax.legend()
+        ax.grid(True)
+        ax.set_ylim(*figure['ylim'])
+    
+    # Add overall title
+    fig.suptitle(figure['title'], fontsize=16)
+    
+    # Adjust layout and save
+    fig.tight_layout()
+    saveimage(figure['name'], fig=fig, folder=folder, extension='png')
+    plt.close(fig)
+    return figure['name']
+
+def render_figures(figures, folder='../data/plots/', jobs=None, force=False):
+    """Render figures in a process pool, skipping those whose data did not change.
+
+    The digest of every figure's data is kept in <folder>/figure_digests.json;
+    a figure is redrawn when its digest differs or its image is missing.
+    """
+    digests_path = os.path.join(folder, 'figure_digests.json')
+    try:
+        with open(digests_path) as f:
+            digests = json.load(f)
+    except FileNotFoundError:
+        digests = {}
+    todo = []
+    for figure in figures:
+        digest = figure_digest(figure)
+        if not force and digests.get(figure['name']) == digest and \
+                os.path.exists(os.path.join(folder, f"{figure['name']}.png")):
+            continue
+        todo.append((figure, digest))
+    print(f"Rendering {len(todo)} of {len(figures)} figures")
+    with ProcessPoolExecutor(jobs) as pool:
+        for (figure, digest), name in zip(todo, pool.map(render_figure, [f for f, _ in todo],
+                                                         [folder] * len(todo))):
+            digests[name] = digest
+    with open(digests_path, 'w') as f:
+        json.dump(digests, f, indent=2)
 
 def main():
-    # Get all energy files
-    energy_files = glob.glob('../data/energy/energy_socket*-*_util-*_run-*.csv')
-    
-    # Group files by utilization level and socket frequency
-    utilizations = set()
-    socket_freqs = set()
-    for file in energy_files:
-        # Extract utilization and socket frequency from filename
-        parts = os.path.basename(file).split('_')
-        util = float(parts[2].split('-')[1])
-        freq = parts[1].split('-')[1]
-        utilizations.add(util)
-        socket_freqs.add(freq)
-    
-    # Sort utilizations and frequencies
-    utilizations = sorted(utilizations)
-    socket_freqs = sorted(socket_freqs)
+    parser = argparse.ArgumentParser(prog='plot_power_side_by_side')
+    parser.add_argument('-j', '--jobs', type=int, help='Figures rendered in parallel (default: CPU count)')
+    parser.add_argument('--max-points', type=int, default=2000, help='Points drawn per trace after decimation')
+    parser.add_argument('--force', action='store_true', help='Redraw figures whose data did not change')
+    parser.add_argument('--index', default=INDEX_PATH, help='Run index database (see run_index.py)')
+    parser.add_argument('--energy-dir', default=ENERGY_DIR, help='Directory scanned for runs missing from the index')
+    args = parser.parse_args()
+
+    # Select runs from the run index, adding logs it does not know yet
+    with RunIndex(args.index) as index:
+        index.scan(args.energy_dir)
+        freqs = index.values('freq')
+        utilizations = index.values('utilization')
+        
+        # Group files by passive socket, socket frequency and utilization level
+        runs = {}
+        for run in index.query():
+            key = (run['passive_socket'], run['freq'], util_label(run['utilization']))
+            runs.setdefault(key, []).append(run['path'])
+    
+    # Combine each configuration once; both passes below reuse the result
+    combined = {}
+    def combined_runs(passive_socket, freq, util):
+        key = (passive_socket, freq, util_label(util))
+        if key not in runs:
+            return None
+        if key not in combined:
+            combined[key] = combine_power_runs(sorted(runs[key]))
+        return combined[key]
     
     # Calculate global y-axis limits
     global_min_power = float('inf')
     global_max_power = float('-inf')
+    zones = set()
     
     for active_socket in [0, 1]:
         for util in utilizations:
-            for freq in ["0.8GHz", "1.5GHz", "2.2GHz"]:
+            for freq in freqs:
                 # Find all runs for this configuration
                 passive_socket = 1 - active_socket
-                pattern = f'../data/energy/energy_socket{passive_socket}-{freq}_util-{util:.1f}_run-*.csv'
-                matching_files = glob.glob(pattern)
+                combined_df = combined_runs(passive_socket, freq, util)
                 
-                if not matching_files:
+                if combined_df is None:
                     continue
                 
-                # Combine power measurements across runs
-                combined_df = combine_power_runs(matching_files)
-                
-                # Check both socket power values
-                for socket in [0, 1]:
-                    power_values = combined_df[f'power_zone_{socket}_mean']
+                # Check every zone's power values
+                for col in combined_df.columns:
+                    if not col.endswith('_mean'):
+                        continue
+                    zones.add(col[len('power_zone_'):-len('_mean')])
+                    power_values = combined_df[col].dropna()
                     
                     # Calculate quartiles and IQR to exclude outliers
                     Q1 = power_values.quantile(0.25)
@@ -135,63 +286,17 @@ def main():
     padding = (global_max_power - global_min_power) * 0.1
     global_min_power -= padding
     global_max_power += padding
+    
+    zones = sorted(zones, key=lambda z: [int(x) for x in z.split('_')])
      
-    # Create side-by-side plots for each active socket and utilization level
+    # Compute every figure's data first, then draw them in parallel
+    figures = []
     for active_socket in [0, 1]:
-        passive_socket = 1 - active_socket
-        
         for util in utilizations:
-            # Create figure with two subplots
-            fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(20, 6))
-            
-            # Plot for each frequency
-            for freq in ["0.8GHz", "1.2GHz", "1.5GHz", "1.8GHz", "2.0GHz", "2.2GHz"]:
-                # Find all runs for this configuration
-                pattern = f'../data/energy/energy_socket{passive_socket}-{freq}_util-{util:.1f}_run-*.csv'
-                matching_files = glob.glob(pattern)
-                
-                if not matching_files:
-                    continue
-                
-                # Combine power measurements across runs
-                combined_df = combine_power_runs(matching_files)
-                
-                # Plot socket 0 power with error bars
-                time = combined_df['timestamp'] - combined_df['timestamp'].iloc[0]
-                ax1.errorbar(time, 
-                           combined_df['power_zone_0_mean'],
-                           yerr=combined_df['power_zone_0_std'],
-                           label=f'Frequency of socket {passive_socket} = {freq}')
-                
-                # Plot socket 1 power with error bars
-                ax2.errorbar(time,
-                           combined_df['power_zone_1_mean'],
-                           yerr=combined_df['power_zone_1_std'],
-                           label=f'Frequency of socket {passive_socket} = {freq}')
-            
-            # Set titles and labels for socket 0 plot
-            ax1.set_xlabel('Time (s)')
-            ax1.set_ylabel('Power Consumption (W)')
-            ax1.set_title(f'Socket 0 Power Consumption\n')
-            ax1.legend()
-            ax1.grid(True)
-            ax1.set_ylim(global_min_power, global_max_power)
-            
-            # Set titles and labels for socket 1 plot
-            ax2.set_xlabel('Time (s)')
-            ax2.set_ylabel('Power Consumption (W)')
-            ax2.set_title(f'Socket 1 Power Consumption\n')
-            ax2.legend()
-            ax2.grid(True)
-            ax2.set_ylim(global_min_power, global_max_power)
-            
-            # Add overall title
-            fig.suptitle(f'Power Consumption | Active Socket: {active_socket} | Active Socket Freq = 1.2GHz | Active Socket Utilization = {util*100}%', fontsize=16)
-            
-            # Adjust layout and save
-            plt.tight_layout()
-            saveimage(f'power_side_by_side_active{active_socket}_util_{util:.1f}', folder='../data/plots/', extension='png')
-            plt.close()
+            figures.append(figure_data(active_socket, util, freqs,
+                                       zones, combined_runs, (global_min_power, global_max_power), args.max_points))
+    os.makedirs('../data/plots/', exist_ok=True)
+    render_figures(figures, jobs=args.jobs, force=args.force)
 
 if __name__ == "__main__":
     main() 
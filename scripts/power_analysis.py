@@ -0,0 +1,312 @@
+import os
+import json
+import hashlib
+import argparse
+import warnings
+import numpy as np
+import pandas as pd
+from binlog import read_header, read_log
+from paths import meta_path, phases_path, side_path
+
+CACHE_DIR = '../data/cache'
+
+ENERGY_PREFIX = 'energy_zone_'
+
+# Wrap range assumed for logs recorded without their zones' max_energy_range_uj
+LEGACY_ENERGY_RANGE = 2**32
+
+# Bumped whenever load_run() computes power differently, to invalidate the cache
+CACHE_VERSION = 2
+
+def read_energy(path):
+    """Read an energy log (CSV or binlog); return (timestamps, energy, zone columns).
+
+    energy is a samples x zones float64 array of counter values in microjoules.
+    """
+    if path.endswith('.bin'):
+        records, _ = read_log(path)
+        zones = [c for c in records.dtype.names if c.startswith(ENERGY_PREFIX)]
+        timestamps = np.asarray(records['timestamp'], dtype=np.float64)
+        energy = np.stack([records[c].astype(np.float64) for c in zones], axis=-1)
+    else:
+        df = pd.read_csv(path)
+        zones = [c for c in df.columns if c.startswith(ENERGY_PREFIX)]
+        timestamps = pd.to_numeric(df['timestamp']).to_numpy(dtype=np.float64)
+        energy = df[zones].to_numpy(dtype=np.float64)
+    return timestamps, energy, zones
+
+def log_zones(path):
+    """Zone columns of an energy log, read from its header only."""
+    if path.endswith('.bin'):
+        columns = [name for name, _ in read_header(path)[0]]
+    else:
+        columns = pd.read_csv(path, nrows=0).columns
+    return [c for c in columns if c.startswith(ENERGY_PREFIX)]
+
+def zone_union(zone_lists):
+    """Every zone of several runs, each package followed by its subzones.
+
+    Runs recorded with and without subzones (energy_logger.py --subzones)
+    can then be analysed together, see align_zones().
+    """
+    return sorted(set().union(*zone_lists), key=lambda z: [int(x) for x in z[len(ENERGY_PREFIX):].split('_')])
+
+def align_zones(power, zones, all_zones):
+    """Rearrange the last axis of power from zones to all_zones, with NaN for zones the run did not log."""
+    aligned = np.full(power.shape[:-1] + (len(all_zones),), np.nan)
+    for i, zone in enumerate(zones):
+        aligned[..., all_zones.index(zone)] = power[..., i]
+    return aligned
+
+def zone_ranges(path, zones):
+    """Counter wrap range in microjoules of every zone of an energy log.
+
+    The ranges come from the zones' max_energy_range_uj recorded with the
+    log (the meta sidecar, or the header of a binary log); zones recorded
+    without one fall back to LEGACY_ENERGY_RANGE.
+    """
+    meta = {}
+    if os.path.exists(meta_path(path)):
+        with open(meta_path(path)) as f:
+            meta = json.load(f)
+    elif path.endswith('.bin'):
+        _, meta = read_log(path)
+    recorded = meta.get('zones', {})
+    return np.array([recorded.get(z, {}).get('max_energy_range_uj', LEGACY_ENERGY_RANGE) for z in zones],
+                    dtype=np.float64)
+
+def counter_power(timestamps, energy, max_value=LEGACY_ENERGY_RANGE):
+    """Power in watts from energy counters, for any number of stacked runs.
+
+    timestamps has shape (..., samples) and energy (..., samples, zones).
+    max_value is the counter wrap range, one for all zones or one per zone
+    (see zone_ranges()).  Counters only decrease when they wrap, so every
+    difference is taken modulo the range, which is exact as long as no
+    interval spans a whole range (see missed_wraps()).  The first sample of
+    every run has no power and is NaN, as are padded samples.
+    """
+    diff = np.mod(np.diff(energy, axis=-2), max_value)
+    dt = np.diff(timestamps, axis=-1)[..., None]
+    power = diff / dt / 1e6
+    pad = np.full(power.shape[:-2] + (1,) + power.shape[-1:], np.nan)
+    return np.concatenate([pad, power], axis=-2)
+
+def missed_wraps(timestamps, power, max_value=LEGACY_ENERGY_RANGE, max_power=None):
+    """Mask of the samples whose interval is long enough to hide a whole counter wrap.
+
+    power is counter_power()'s result.  An interval can hide a wrap when the
+    zone could have used max_value microjoules in it at max_power watts,
+    which defaults to twice the highest power the zone shows in the log.
+    """
+    if max_power is None:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            max_power = 2 * np.nanmax(power, axis=-2, keepdims=True)
+    dt = np.diff(timestamps, axis=-1, prepend=np.nan)[..., None]
+    with np.errstate(invalid='ignore'):
+        return dt * max_power * 1e6 >= max_value
+
+def iter_energy(path, chunk_size=65536):
+    """Yield (timestamps, energy, zone columns) of an energy log chunk by chunk, see read_energy()."""
+    if path.endswith('.bin'):
+        records, _ = read_log(path)
+        zones = [c for c in records.dtype.names if c.startswith(ENERGY_PREFIX)]
+        for start in range(0, len(records), chunk_size):
+            chunk = records[start:start + chunk_size]
+            yield (np.asarray(chunk['timestamp'], dtype=np.float64),
+                   np.stack([chunk[c].astype(np.float64) for c in zones], axis=-1), zones)
+    else:
+        for df in pd.read_csv(path, chunksize=chunk_size):
+            zones = [c for c in df.columns if c.startswith(ENERGY_PREFIX)]
+            yield (pd.to_numeric(df['timestamp']).to_numpy(dtype=np.float64),
+                   df[zones].to_numpy(dtype=np.float64), zones)
+
+class CounterDeltas:
+    """Energy counter differences over a log read in chunks.
+
+    The last sample of every chunk is kept, so the interval spanning a
+    chunk boundary is not lost and a wraparound across it is corrected like
+    any other (see counter_power()); max_value may hold one range per zone.
+    """
+
+    def __init__(self, max_value=LEGACY_ENERGY_RANGE):
+        self.max_value = max_value
+        self.last = None
+
+    def update(self, timestamps, energy):
+        """Return (end time, length in seconds, joules per zone) of every new sampling interval."""
+        if self.last is not None:
+            timestamps = np.concatenate([[self.last[0]], timestamps])
+            energy = np.concatenate([self.last[1][None], energy])
+        if len(timestamps):
+            self.last = (timestamps[-1], energy[-1])
+        diff = np.mod(np.diff(energy, axis=0), self.max_value)
+        return timestamps[1:], np.diff(timestamps), diff / 1e6
+
+class WindowedPower:
+    """Per-window mean, minimum and maximum power and cumulative joules, in fixed memory.
+
+    Windows are `window` seconds long and start at the beginning of the
+    first sampling interval; every interval counts towards the window its
+    end falls in.  The mean is energy over time, so irregular sampling is
+    weighted correctly, while minimum and maximum are over the sample powers.
+    Only the window still open is kept between update() calls.
+    """
+
+    def __init__(self, zones, window=1.0):
+        self.names = [f'power_{zone[7:]}' for zone in zones]
+        self.window = window
+        self.origin = None
+        self.open = None
+        self.total = np.zeros(len(zones))
+
+    def _rows(self, index, seconds, joules, low, high, samples):
+        rows = []
+        for i in range(len(index)):
+            self.total += joules[i]
+            row = {'timestamp': self.origin + index[i] * self.window, 'seconds': seconds[i], 'samples': samples[i]}
+            for z, name in enumerate(self.names):
+                row[f'{name}_mean'] = joules[i, z] / seconds[i]
+                row[f'{name}_min'] = low[i, z]
+                row[f'{name}_max'] = high[i, z]
+                row[f'{name}_joules'] = self.total[z]
+            rows.append(row)
+        return rows
+
+    def update(self, times, dt, joules):
+        """Add intervals from CounterDeltas.update(); return the rows of the windows they complete."""
+        if not len(times):
+            return []
+        if self.origin is None:
+            self.origin = times[0] - dt[0]
+        index = np.floor((times - self.origin) / self.window).astype(np.int64)
+        power = joules / dt[:, None]
+        starts = np.flatnonzero(np.r_[True, index[1:] != index[:-1]])
+        windows = [index[starts], np.add.reduceat(dt, starts), np.add.reduceat(joules, starts, axis=0),
+                   np.minimum.reduceat(power, starts, axis=0), np.maximum.reduceat(power, starts, axis=0),
+                   np.diff(np.r_[starts, len(times)])]
+        if self.open is not None:
+            if self.open[0][0] == windows[0][0]:
+                # The chunk continues the window left open by the previous one
+                windows[1][0] += self.open[1][0]
+                windows[2][0] += self.open[2][0]
+                windows[3][0] = np.minimum(windows[3][0], self.open[3][0])
+                windows[4][0] = np.maximum(windows[4][0], self.open[4][0])
+                windows[5][0] += self.open[5][0]
+                done = []
+            else:
+                done = self._rows(*self.open)
+        else:
+            done = []
+        self.open = [w[-1:] for w in windows]
+        return done + self._rows(*[w[:-1] for w in windows])
+
+    def finish(self):
+        """Rows of the last, possibly partial, window."""
+        rows = self._rows(*self.open) if self.open is not None else []
+        self.open = None
+        return rows
+
+def windowed_power(path, window=1.0, chunk_size=65536):
+    """Yield per-window power rows of an energy log (see WindowedPower) in one chunked pass."""
+    deltas = None
+    windows = None
+    for timestamps, energy, zones in iter_energy(path, chunk_size):
+        if windows is None:
+            deltas = CounterDeltas(zone_ranges(path, zones))
+            windows = WindowedPower(zones, window)
+        yield from windows.update(*deltas.update(timestamps, energy))
+    if windows is not None:
+        yield from windows.finish()
+
+def parse_run_name(path):
+    """Parameters encoded in an energy_socket<S>-<F>_util-<U>_run-<R> file name."""
+    parts = os.path.splitext(os.path.basename(path))[0].split('_')
+    socket, freq = parts[1][len('socket'):].split('-')
+    return {'passive_socket': int(socket), 'freq': freq,
+            'utilization': float(parts[2].split('-')[1]), 'run': int(parts[3].split('-')[1])}
+
+def load_phases(path):
+    """Return {phase name: (start, end)} wall-clock times for an energy log, or None."""
+    try:
+        with open(phases_path(path)) as f:
+            record = json.load(f)
+    except FileNotFoundError:
+        return None
+    return {p['name']: (p['start'], p['end']) for p in record['phases']}
+
+def _cache_path(path, cache_dir):
+    key = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()
+    return os.path.join(cache_dir, f'{key}.npz')
+
+def load_run(path, cache_dir=CACHE_DIR):
+    """Return (timestamps, power, zone columns) for one run, cached on disk.
+
+    The cache entry is keyed by the log's path and is reused while the log's
+    size and modification time are unchanged.  Counters wrap at the ranges
+    recorded with the log (see zone_ranges()), and a warning is issued when
+    the sampling interval was long enough to miss a wrap.
+    """
+    stat = os.stat(path)
+    stamp = np.array([stat.st_size, stat.st_mtime_ns, CACHE_VERSION], dtype=np.int64)
+    cached = _cache_path(path, cache_dir) if cache_dir else None
+    if cached and os.path.exists(cached):
+        with np.load(cached) as data:
+            if np.array_equal(data['stamp'], stamp):
+                return data['timestamps'], data['power'], [str(z) for z in data['zones']]
+    timestamps, energy, zones = read_energy(path)
+    ranges = zone_ranges(path, zones)
+    power = counter_power(timestamps, energy, ranges)
+    missed = missed_wraps(timestamps, power, ranges)
+    if missed.any():
+        warnings.warn(f'{path}: {int(missed.any(axis=-1).sum())} sampling intervals are long enough to miss '
+                      f'a counter wrap in {[z for z, m in zip(zones, missed.any(axis=0)) if m]}')
+    if cached:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = cached + '.tmp.npz'
+        np.savez(tmp, stamp=stamp, timestamps=timestamps, power=power, zones=np.array(zones))
+        os.replace(tmp, cached)
+    return timestamps, power, zones
+
+def stack_runs(paths, cache_dir=CACHE_DIR):
+    """Load several runs into NaN-padded arrays.
+
+    Returns (timestamps, power, zones, lengths) where timestamps is
+    runs x samples, power is runs x samples x zones and lengths holds the
+    number of valid samples of each run.  zones are those of all runs
+    together; a zone a run did not log is NaN in that run.
+    """
+    runs = [load_run(p, cache_dir) for p in paths]
+    zones = zone_union(run_zones for _, _, run_zones in runs)
+    lengths = np.array([len(t) for t, _, _ in runs])
+    timestamps = np.full((len(runs), lengths.max()), np.nan)
+    power = np.full((len(runs), lengths.max(), len(zones)), np.nan)
+    for i, (t, p, run_zones) in enumerate(runs):
+        timestamps[i, :len(t)] = t
+        power[i, :len(t)] = align_zones(p, run_zones, zones)
+    return timestamps, power, zones, lengths
+
+def main():
+    parser = argparse.ArgumentParser(prog='power_analysis',
+                                     description='Per-window power of an energy log, computed in one chunked pass')
+    parser.add_argument('log', help='Energy log (CSV or binlog)')
+    parser.add_argument('-o', '--output', help='Output CSV (default: <log>.windows.csv)')
+    parser.add_argument('-w', '--window', type=float, default=1.0, help='Window length in seconds')
+    parser.add_argument('--chunk-size', type=int, default=65536, help='Samples read at a time')
+    args = parser.parse_args()
+
+    output = args.output or side_path(args.log, 'windows', 'csv')
+    header = True
+    with open(output, 'w', newline='') as f:
+        batch = []
+        for row in windowed_power(args.log, args.window, args.chunk_size):
+            batch.append(row)
+            if len(batch) == 1024:
+                pd.DataFrame(batch).to_csv(f, index=False, header=header)
+                header = False
+                batch = []
+        if batch or header:
+            pd.DataFrame(batch).to_csv(f, index=False, header=header)
+
+if __name__ == "__main__":
+    main()
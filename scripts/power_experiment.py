@@ -1,45 +1,201 @@
 import argparse
-import threading
+import json
+import os
+import shlex
 import time
 import sys
+import asyncio
+import threading
 sys.path.append("../cloudlab-lib")
 import cloudlab_lib
+from paths import freq_path, meta_path, phases_path, side_paths, target_path, uncore_path, util_path, work_path
+from run_index import RunIndex
+from session import NodeSession
+from stream import watch
+from topology import Cpu, physical_cores, place, reserve_core, socket_cpus
+from sweep import expand_grid, run_sweep
+from tracing import TracedAgent, Tracer, span, summarize
+
+REMOTE_SCRIPTS_DIR = "/users/varuncg/power-exp/scripts"
 
 def get_cpu_topology(node, cl):
-    """Get CPU topology for a node and return a dictionary mapping sockets to their cores."""
-    # Get CPU info using lscpu
-    cmd = "lscpu -p=cpu,node | grep -v '#'"
+    """Get the CPU topology of a node from sysfs: a list of topology.Cpu records."""
+    cmd = f"cd {REMOTE_SCRIPTS_DIR} && python3 topology.py"
     stdout, stderr, exit_status = cl.run_on_node(node, cmd)
     
     if exit_status != 0:
         raise Exception(f"Failed to get CPU topology: {stderr}")
     
-    # Parse the output to create socket -> cores mapping
-    socket_cores = {}
-    for line in stdout:
-        cpu, socket = map(int, line.strip().split(','))
-        if socket not in socket_cores:
-            socket_cores[socket] = []
-        socket_cores[socket].append(cpu)
-    
-    return socket_cores
+    return [Cpu(**cpu) for cpu in json.loads("".join(stdout))]
 
-def run_busy_loop(node, cores, duration, cl):
-    """Run busy_loop.py on specified cores."""
-    core_list = ",".join(map(str, cores))
+def run_node_agent(session, spec, phases_file):
+    """Hand a whole experiment spec to node_agent.py, which starts everything together."""
     cmd = f"""
-    cd /users/varuncg/power-exp/scripts;
-    python3 busy_loop.py -d {duration} -c {core_list}
+    cd {REMOTE_SCRIPTS_DIR};
+    sudo python3 node_agent.py -o {phases_file} --spec {shlex.quote(json.dumps(spec))}
     """
-    return cl.run_on_node(node, cmd)
+    return session.run(cmd)
 
-def run_energy_logger(node, socket, duration, cl, filename):
-    """Run energy_logger.py on a specific socket."""
-    cmd = f"""
-    cd /users/varuncg/power-exp/scripts;
-    taskset -c {socket} python3 energy_logger.py -d {duration} -n 2 -f {filename}
+def node_address(session):
+    """Fully qualified host name of a session's node, which resolves from outside the experiment."""
+    def query():
+        stdout, stderr, exit_status = session.run("hostname -f")
+        if exit_status != 0:
+            raise Exception(f"Failed to get the host name of {session.node}: {stderr}")
+        return "".join(stdout).strip()
+    return session.cached("address", query)
+
+def node_topology(session):
+    """CPU topology of a session's node, queried once per session."""
+    def query():
+        with session.span("topology"):
+            return get_cpu_topology(session.node, session.cl)
+    return session.cached("topology", query)
+
+def run_experiment(session, topology, active_socket, socket_freqs, utilization, duration, filename,
+                   settle=0, prepare=(), warmup=0, drain=0, load_mode="cores", kernel="loop",
+                   profile=None, stream_port=None, placement="spread", smt=False, telemetry=False):
+    """Set frequencies, then run the energy logger and busy loops together on a node.
+
+    topology is the node's list of topology.Cpu records and socket_freqs
+    maps every socket to its frequency.  Any `prepare` commands and the
+    governor and frequency settings of the agent's helpers are sent as one
+    batch (NodeSession.setup).  The busy
+    loops run on the physical cores of the active socket for `duration`
+    seconds, either as int(cores * utilization) fully busy cores (load_mode
+    "cores") or as every core duty-cycled at `utilization` (load_mode
+    "duty"), running the given busy_loop.py kernel.  Cores are picked with
+    topology.place() and the `placement` policy; SMT siblings are only used
+    with `smt`, which also counts them as cores.  With a load profile (the
+    text of a load_profile.py CSV/JSON file, named by `profile` as (name,
+    content)), every core of the active socket follows the profile instead,
+    and the targets and a utilization trace of those cores are recorded.
+    Every trace is sampled by one telemetry.py process, so samples taken
+    together share a seq number across the files.  It records every RAPL
+    zone with its subzones, is pinned to topology.reserve_core() of
+    another socket, which no load shares, and also covers `warmup` seconds
+    before and `drain` seconds after the load.
+    Phase boundaries, the work the load completed and the RAPL zones' wrap
+    ranges are written next to the energy trace, see
+    paths.phases_path(), work_path() and meta_path().
+    With a `stream_port` core frequencies are logged too, and every sample
+    is published on that TCP port for monitor_nodes().  With `telemetry`,
+    the core and uncore frequency and the utilization of every CPU are
+    logged as well (paths.freq_path(), uncore_path() and util_path()), as
+    the power_model.py fits need.
+    Every step is timed as a span of the session (see NodeSession.span).
+    Returns the names of the files the experiment wrote.
+    """
+    node = session.node
+    
+    # Run the preparation commands and set governor and frequencies in one round-trip
+    print(f"[{node}] Setting power governor and frequencies...")
+    socket_cores = socket_cpus(topology)
+    with session.span("setup", freqs=socket_freqs):
+        session.setup(prepare, socket_cores, socket_freqs)
+    with session.span("settle"):
+        time.sleep(settle)
+    
+    # Keep a physical core of another socket free for the loggers
+    logger_socket = next(s for s in sorted(socket_cores) if s != active_socket)
+    logger_core = reserve_core(topology, logger_socket)
+    
+    # Calculate number of cores to use based on utilization
+    available = [ts for ts in physical_cores(topology).values()
+                 if ts[0].package == active_socket and logger_core not in [t.cpu for t in ts]]
+    num_available = sum(len(ts) for ts in available) if smt else len(available)
+    if profile:
+        num_cores_to_use = num_available
+        load_args = ["--profile", profile[0], "--profile-log", target_path(filename)]
+    elif load_mode == "duty":
+        num_cores_to_use = num_available
+        load_args = ["-u", utilization]
+    else:
+        num_cores_to_use = int(num_available * utilization)
+        load_args = []
+    cores_to_use = place(topology, num_cores_to_use, placement, smt, {active_socket}, [logger_core])
+    load_args += ["-k", kernel, "-w", work_path(filename)]
+    
+    # One telemetry.py process samples every probe on one clock, see telemetry.Collector
+    outputs = [filename, meta_path(filename), phases_path(filename)] + ([work_path(filename)] if cores_to_use else [])
+    logger_args = ["--log", filename, "--numsockets", 2, "--subzones", "--energy-interval", 0.01]
+    all_cpus = ",".join(str(c.cpu) for c in topology)
+    if telemetry or stream_port:
+        logger_args += ["--freq-interval", 0.1, "--freq-cores", all_cpus]
+        outputs.append(freq_path(filename))
+    if telemetry:
+        logger_args += ["--uncore-interval", 0.1]
+        outputs.append(uncore_path(filename))
+    if profile or telemetry:
+        util_cpus = all_cpus if telemetry else ",".join(map(str, cores_to_use))
+        logger_args += ["--util-interval", 0.1, "--util-cores", util_cpus]
+        outputs.append(util_path(filename))
+    if stream_port:
+        logger_args += ["--stream", f"tcp:{stream_port}"]
+
+    # The node agent spawns the logger and the busy loops and starts them on one deadline
+    print(f"[{node}] Starting telemetry and busy loop for {num_cores_to_use} cores...")
+    spec = {
+        "duration": duration,
+        "warmup": warmup,
+        "drain": drain,
+        "loggers": [{"script": "telemetry.py", "core": logger_core, "args": logger_args}],
+        "loads": [{"script": "busy_loop.py", "args": ["-c", ",".join(map(str, cores_to_use))] + load_args}]
+                 if cores_to_use else [],
+    }
+    if profile:
+        spec["files"] = {profile[0]: profile[1]}
+        outputs.append(target_path(filename))
+    with session.span("experiment", duration=duration, warmup=warmup, drain=drain) as recorded:
+        _, stderr, exit_status = run_node_agent(session, spec, phases_path(filename))
+        recorded["exit_status"] = exit_status
+    if exit_status != 0:
+        raise Exception(f"Experiment failed on {node}: {stderr}")
+    return outputs
+
+def monitor_nodes(sessions, port, interval=1.0):
+    """Print rolling live power and core frequency of every session's node until the returned event is set.
+
+    Connects to the telemetry stream started with `stream_port` at the
+    nodes' node_address(), since the experiment's node names do not
+    resolve from here.  Nodes whose loggers are not running yet are retried,
+    so the monitor can be started before the experiments.
     """
-    return cl.run_on_node(node, cmd)
+    stop = threading.Event()
+    sources = {}
+    for session in sessions:
+        host = node_address(session)
+        sources[session.node] = f"tcp:{host}:{port}"
+    threading.Thread(target=lambda: asyncio.run(watch(sources, interval, stop=stop)), daemon=True).start()
+    return stop
+
+def run_sweep_point(session, point, settle, warmup, drain, stream_port=None):
+    """Run one sweep point on a node, copy its energy trace and side files to ../data/energy and index them."""
+    topology = node_topology(session)
+    socket_cores = socket_cpus(topology)
+    passive_socket = point["passive_socket"]
+    active_socket = next(s for s in sorted(socket_cores) if s != passive_socket)
+    socket_freqs = {socket: point["active_freq"] for socket in socket_cores}
+    socket_freqs[passive_socket] = point["freq"]
+    
+    profile = None
+    if "profile" in point:
+        with open(point["profile"]) as f:
+            profile = (os.path.basename(point["profile"]), f.read())
+    
+    filename = f"energy_{point['id']}.csv"
+    outputs = run_experiment(session, topology, active_socket, socket_freqs,
+                             point["utilization"], point["duration"], filename, settle,
+                             prepare=[f"cd {REMOTE_SCRIPTS_DIR} && rm -f {' '.join([filename] + side_paths(filename))}"],
+                             warmup=warmup, drain=drain, load_mode=point.get("load_mode", "cores"),
+                             kernel=point.get("kernel", "loop"), profile=profile, stream_port=stream_port,
+                             placement=point.get("placement", "spread"), smt=point.get("smt", False),
+                             telemetry=point.get("telemetry", False))
+    with session.span("fetch", files=len(outputs)):
+        session.fetch([f"{REMOTE_SCRIPTS_DIR}/{name}" for name in outputs], "../data/energy")
+    with session.span("index"), RunIndex() as index:
+        index.record(f"../data/energy/{filename}", [f"../data/energy/{name}" for name in outputs],
+                     node=session.node, params=dict(point, socket_cores=socket_cores))
 
 def main():
     parser = argparse.ArgumentParser(description='Power experiment script')
@@ -48,19 +204,47 @@ def main():
     parser.add_argument('--setup', action='store_true', help='Setup the environment')
     parser.add_argument('--run', action='store_true', help='Run the experiment')
     parser.add_argument('--utilization', type=float, default=0.5, help='CPU utilization (0.0 to 1.0)')
+    parser.add_argument('--load-mode', choices=['cores', 'duty'], default='cores', help='Reach the utilization with fully busy cores or by duty-cycling every core')
+    parser.add_argument('--profile', help='Load profile file (see load_profile.py) to follow instead of --utilization')
+    parser.add_argument('--placement', choices=['spread', 'pack'], default='spread', help='How loads are placed on the active socket (see topology.place)')
+    parser.add_argument('--smt', action='store_true', help='Also load SMT siblings, counting them as cores')
+    parser.add_argument('--telemetry', action='store_true', help='Also log core/uncore frequency and utilization (see power_model.py)')
+    parser.add_argument('--kernel', default='loop', help='busy_loop.py workload kernel (see workloads.py)')
     parser.add_argument('--duration', type=int, default=60, help='Duration of experiment in seconds')
     parser.add_argument('--node', default='node-0', help='Target node to run experiment on')
+    parser.add_argument('--sweep', help='Path to a sweep grid JSON file (see sweep.expand_grid)')
+    parser.add_argument('--nodes', help='Comma-separated list of nodes to spread the sweep over (default: --node)')
+    parser.add_argument('--state', default='sweep_state.jsonl', help='Sweep progress file, used to resume')
+    parser.add_argument('--cooldown', type=float, default=30, help='Idle seconds on a node between sweep points')
+    parser.add_argument('--warmup', type=float, default=2, help='Seconds logged before the load starts')
+    parser.add_argument('--drain', type=float, default=2, help='Seconds logged after the load stops')
+    parser.add_argument('--settle', type=float, default=5, help='Seconds to wait after setting frequencies')
+    parser.add_argument('--retries', type=int, default=2, help='Retries of a failed sweep point')
+    parser.add_argument('--live', type=int, metavar='PORT', help='Stream energy and frequency samples on this port and print live power and frequency of every node')
+    parser.add_argument('--trace', help='Write a Chrome trace of every step and remote command to this file and print where the time went')
     
     args = parser.parse_args()
     
     # Initialize CloudLab agent
     cl = cloudlab_lib.CloudLabAgent(args.config)
-    
+    tracer = Tracer() if args.trace else None
+    if tracer:
+        cl = TracedAgent(cl, tracer)
+    try:
+        orchestrate(args, cl, tracer)
+    finally:
+        if tracer:
+            tracer.write(args.trace)
+            print(summarize(tracer.spans))
+
+def orchestrate(args, cl, tracer):
+    """Run the steps selected on the command line through the agent cl."""
     # Disable Intel P-state if requested
     if args.disable_intelpstate:
         print("Disabling Intel P-state driver...")
         cl.turn_intel_pstate_driver("all", "off")
-        time.sleep(5)  # Wait for changes to take effect
+        with span(tracer, "pstate_settle", "all"):
+            time.sleep(5)  # Wait for changes to take effect
     
     # Setup if requested
     if args.setup:
@@ -74,57 +258,57 @@ def main():
         # cl.run("all", "sudo ethtool -K enp94s0f0 ntuple on")
         # cl.run("all", "sudo apt-get install chrony -y")
 
+    sessions = {}
+    def session_for(node):
+        return sessions.setdefault(node, NodeSession(node, cl, tracer))
+
+    monitor = None
+    if args.live and (args.run or args.sweep):
+        nodes = args.nodes.split(",") if args.sweep and args.nodes else [args.node]
+        monitor = monitor_nodes([session_for(node) for node in nodes], args.live)
+
     if args.run:
     
+        session = session_for(args.node)
+    
         # Get CPU topology
         print("Getting CPU topology...")
-        socket_cores = get_cpu_topology(args.node, cl)
-        print(f"CPU topology: {socket_cores}")
+        topology = node_topology(session)
+        socket_cores = socket_cpus(topology)
+        print(f"CPU topology: {socket_cores}, {len(physical_cores(topology))} physical cores")
         
-
-        cl.run(args.node, "mkdir -p energy")
-        # Set power governor to userspace and set frequencies
-        print("Setting power governor and frequencies...")
-        cl.set_power_governor(args.node, "userspace")
-        for socket in socket_cores:
-            cl.set_frequency(args.node, ",".join(map(str, socket_cores[socket])), "1.2GHz")
-        
-        # Calculate number of cores to use based on utilization
-        socket1_cores = socket_cores[1]  # Get cores from socket 1
-        num_cores_to_use = int(len(socket1_cores) * args.utilization)
-        cores_to_use = socket1_cores[:num_cores_to_use]
-        
-        # Create all threads
-        print("Creating threads...")
-        threads = []
-        
-        # Create energy logger thread
-        filename = "energy.csv"
-        energy_thread = threading.Thread(
-            target=run_energy_logger,
-            args=(args.node, socket_cores[0][0], args.duration, cl, filename)
-        )
-        threads.append(energy_thread)
+        socket_freqs = {socket: "1.2GHz" for socket in socket_cores}
+        profile = None
+        if args.profile:
+            with open(args.profile) as f:
+                profile = (os.path.basename(args.profile), f.read())
         
-        # Create busy loop thread (now runs all cores in a single process)
-        print(f"Creating busy loop for {num_cores_to_use} cores...")
-        busy_thread = threading.Thread(
-            target=run_busy_loop,
-            args=(args.node, cores_to_use, args.duration, cl)
-        )
-        threads.append(busy_thread)
-        
-        # Start all threads together
-        print("Starting all threads...")
-        for thread in threads:
-            thread.start()
-        
-        # Wait for all threads to complete
-        print("Waiting for experiment to complete...")
-        for thread in threads:
-            thread.join()
+        # Load runs on socket 1; the energy logger sits on socket 0
+        print("Starting experiment...")
+        run_experiment(session, topology, 1, socket_freqs,
+                       args.utilization, args.duration, "energy.csv",
+                       prepare=["mkdir -p energy"], warmup=args.warmup, drain=args.drain,
+                       load_mode=args.load_mode, kernel=args.kernel, profile=profile, stream_port=args.live,
+                       placement=args.placement, smt=args.smt, telemetry=args.telemetry)
         
         print("Experiment completed!")
 
+    if args.sweep:
+        with open(args.sweep) as f:
+            try:
+                points = expand_grid(json.load(f))
+            except ValueError as e:
+                parser.error(f"--sweep: {e}")
+        nodes = args.nodes.split(",") if args.nodes else [args.node]
+        with span(tracer, "sweep", points=len(points)):
+            failed = run_sweep(points, nodes,
+                               lambda node, point: run_sweep_point(session_for(node), point, args.settle,
+                                                                           args.warmup, args.drain, args.live),
+                               args.state, args.cooldown, args.retries, tracer)
+        print(f"Sweep completed, {len(failed)} points failed")
+
+    if monitor:
+        monitor.set()
+
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main() 
@@ -0,0 +1,234 @@
+import os
+import sys
+import json
+import argparse
+import itertools
+import numpy as np
+import pandas as pd
+from binlog import read_log
+from paths import freq_path, uncore_path, util_path
+from power_analysis import ENERGY_PREFIX, load_phases, load_run, parse_run_name
+from run_index import ENERGY_DIR, INDEX_PATH, RunIndex, freq_ghz, run_logs
+
+MODEL_PATH = '../data/power_model.json'
+
+# Active socket frequency of runs that do not record it (see power_experiment.py)
+DEFAULT_ACTIVE_FREQ = '1.2GHz'
+
+# Regressors of socket power: a static part, dynamic power growing with
+# utilization times frequency (voltage rises with frequency, hence the
+# square), and the uncore clock
+FEATURES = ['intercept', 'util', 'util_freq', 'util_freq2', 'freq', 'uncore']
+
+def design(freq, util, uncore=None, features=FEATURES):
+    """Design matrix of the features from core frequency (GHz), utilization (0-1) and uncore frequency (GHz)."""
+    freq, util = np.broadcast_arrays(np.asarray(freq, dtype=np.float64), np.asarray(util, dtype=np.float64))
+    uncore = np.broadcast_to(np.nan if uncore is None else np.asarray(uncore, dtype=np.float64), freq.shape)
+    columns = {'intercept': np.ones_like(freq), 'util': util, 'util_freq': util * freq,
+               'util_freq2': util * freq ** 2, 'freq': freq, 'uncore': uncore}
+    return np.stack([columns[f] for f in features], axis=-1)
+
+def _socket_means(path, column, socket_cores, scale):
+    """Trace of the mean of a per-CPU column over every socket's CPUs, e.g. core_{}_freq, by seq."""
+    trace = pd.read_csv(path)
+    out = pd.DataFrame({'seq': trace['seq']})
+    for socket, cpus in socket_cores.items():
+        names = [column.format(cpu) for cpu in cpus if column.format(cpu) in trace.columns]
+        out[socket] = trace[names].mean(axis=1) * scale if names else np.nan
+    return out
+
+def _on_seq(seq, trace, name):
+    """Join a trace onto the power samples by telemetry.py's seq.
+
+    The power sample of seq s covers the ticks up to s, so it gets the first
+    trace sample at or after s, whose averages (core frequency, utilization)
+    cover the same ticks.  Samples after the last trace sample are NaN.
+    """
+    trace = trace.sort_values('seq')
+    idx = np.searchsorted(trace['seq'].to_numpy(), seq, side='left')
+    values = trace.drop(columns='seq').to_numpy(dtype=np.float64)[np.minimum(idx, len(trace) - 1)]
+    values[idx >= len(trace)] = np.nan
+    return pd.DataFrame(values, columns=[f'{name}_{c}' for c in trace.columns if c != 'seq'])
+
+def _energy_seq(path):
+    """The seq column of an energy log written by telemetry.py, or None for other logs."""
+    if path.endswith('.bin'):
+        records, _ = read_log(path)
+        return np.asarray(records['seq']) if 'seq' in records.dtype.names else None
+    columns = pd.read_csv(path, nrows=0).columns
+    return pd.read_csv(path, usecols=['seq'])['seq'].to_numpy() if 'seq' in columns else None
+
+def joined_run(path, params=None):
+    """One run's load phase as rows of (timestamp, socket, power, freq, util, uncore).
+
+    Package power comes from the energy log; core frequency, uncore
+    frequency and utilization are joined by seq from the traces telemetry.py
+    recorded with it (power_experiment.py --telemetry), averaged over every
+    socket's CPUs.  Runs without those traces or a seq column, or without
+    the socket_cores their index entry records, use the frequency and
+    utilization settings of the run instead (the passive socket idle) and
+    have no uncore frequency.
+    """
+    params = dict(parse_run_name(path), **(params or {}))
+    timestamps, power, zones = load_run(path)
+    packages = {int(z[len(ENERGY_PREFIX):]): i for i, z in enumerate(zones) if z.count('_') == 2}
+    samples = pd.DataFrame({'timestamp': timestamps})
+    seq = _energy_seq(path)
+    phases = load_phases(path)
+    if phases and 'load' in phases:
+        start, end = phases['load']
+        previous = np.concatenate([[np.nan], timestamps[:-1]])
+        keep = (previous >= start) & (timestamps <= end)
+    else:
+        keep = ~np.isnan(power[:, 0])
+    samples = samples[keep].reset_index(drop=True)
+    power = power[keep]
+    seq = seq[keep] if seq is not None else None
+
+    socket_cores = {int(s): cpus for s, cpus in params.get('socket_cores', {}).items()}
+    passive = params['passive_socket']
+    settings = {'freq': {s: freq_ghz(params['freq'] if s == passive else params.get('active_freq', DEFAULT_ACTIVE_FREQ))
+                         for s in packages},
+                'util': {s: 0.0 if s == passive else params['utilization'] for s in packages}}
+    traces = {}
+    if seq is not None and socket_cores and os.path.exists(freq_path(path)):
+        traces['freq'] = _on_seq(seq, _socket_means(freq_path(path), 'core_{}_freq', socket_cores, 1e-3), 'freq')
+    if seq is not None and socket_cores and os.path.exists(util_path(path)):
+        traces['util'] = _on_seq(seq, _socket_means(util_path(path), 'cpu_core_{}', socket_cores, 1e-2), 'util')
+    if seq is not None and os.path.exists(uncore_path(path)):
+        uncore = pd.read_csv(uncore_path(path))
+        uncore = uncore[['seq'] + [f'uncore_freq_{s}' for s in packages]] \
+            .rename(columns={f'uncore_freq_{s}': s for s in packages})
+        uncore[list(packages)] *= 1e-3
+        traces['uncore'] = _on_seq(seq, uncore, 'uncore')
+
+    frames = []
+    for socket, i in packages.items():
+        frame = pd.DataFrame({'run': os.path.basename(path), 'timestamp': samples['timestamp'],
+                              'socket': socket, 'power': power[:, i]})
+        for name in ('freq', 'util'):
+            frame[name] = traces[name][f'{name}_{socket}'] if name in traces else settings[name][socket]
+        frame['uncore'] = traces['uncore'][f'uncore_{socket}'] if 'uncore' in traces else np.nan
+        frame['setting'] = f"{params['passive_socket']}-{params['freq']}-{params['utilization']}"
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+def joined_runs(runs, window=1.0):
+    """Join every run and average it over windows of `window` seconds, per run and socket."""
+    frames = []
+    for path, params in runs:
+        frame = joined_run(path, params)
+        start = frame['timestamp'].min()
+        frame['window'] = np.floor((frame['timestamp'] - start) / window).astype(np.int64)
+        frames.append(frame)
+    joined = pd.concat(frames, ignore_index=True)
+    return joined.groupby(['run', 'setting', 'socket', 'window'], as_index=False).mean(numeric_only=True)
+
+def fit_socket(frame, features):
+    """Least-squares fit of one socket's power; returns the coefficients and their error estimates."""
+    X = design(frame['freq'], frame['util'], frame['uncore'], features)
+    y = frame['power'].to_numpy()
+    coef, _, rank, _ = np.linalg.lstsq(X, y, rcond=None)
+    residual = y - X @ coef
+    dof = max(len(y) - rank, 1)
+    sigma2 = residual @ residual / dof
+    return {'coef': coef.tolist(), 'cov': (sigma2 * np.linalg.pinv(X.T @ X)).tolist(),
+            'sigma': float(np.sqrt(sigma2)), 'n': len(y), 'rank': int(rank),
+            'rmse': float(np.sqrt(np.mean(residual ** 2))),
+            'r2': float(1 - residual @ residual / max(((y - y.mean()) ** 2).sum(), 1e-12))}
+
+def fit(joined, window=1.0):
+    """Fit a power model per socket to joined_runs() rows.
+
+    The uncore term is only used when every row has an uncore frequency.
+    """
+    joined = joined.dropna(subset=['power', 'freq', 'util'])
+    features = [f for f in FEATURES if f != 'uncore' or joined['uncore'].notna().all()]
+    sockets = {int(socket): fit_socket(frame, features) for socket, frame in joined.groupby('socket')}
+    return {'features': features, 'window': window, 'sockets': sockets}
+
+def predict(model, socket, freq, util, uncore=None, z=1.96):
+    """Predicted socket power in watts with the bounds of a z prediction interval.
+
+    freq (GHz), util (0-1) and uncore (GHz) broadcast against each other.
+    The interval combines the uncertainty of the coefficients with the
+    scatter of the windows around the fit.  Returns (mean, low, high).
+    """
+    if 'uncore' in model['features'] and uncore is None:
+        raise ValueError('this model needs the uncore frequency')
+    fitted = model['sockets'][socket]
+    X = design(freq, util, uncore, model['features'])
+    mean = X @ np.array(fitted['coef'])
+    se = np.sqrt(np.einsum('...i,ij,...j->...', X, np.array(fitted['cov']), X) + fitted['sigma'] ** 2)
+    return mean, mean - z * se, mean + z * se
+
+def cross_validate(joined, window=1.0):
+    """RMSE per socket of predicting each setting's windows from a model fitted without that setting."""
+    errors = {}
+    for setting in joined['setting'].unique():
+        held_out = joined[joined['setting'] == setting]
+        model = fit(joined[joined['setting'] != setting], window)
+        for socket, frame in held_out.groupby('socket'):
+            if int(socket) not in model['sockets']:
+                continue
+            uncore = frame['uncore'] if 'uncore' in model['features'] else None
+            mean, _, _ = predict(model, int(socket), frame['freq'], frame['util'], uncore)
+            errors.setdefault(int(socket), []).append((frame['power'].to_numpy() - mean) ** 2)
+    return {socket: float(np.sqrt(np.nanmean(np.concatenate(e)))) for socket, e in errors.items()}
+
+def _selected_runs(args):
+    if args.pattern:
+        return [(path, None) for path in run_logs(args.pattern)]
+    with RunIndex(args.index) as index:
+        index.scan(args.energy_dir)
+        return [(run['path'], json.loads(run['params'])) for run in index.query()]
+
+def main():
+    parser = argparse.ArgumentParser(prog='power_model',
+                                     description='Fit socket power to core/uncore frequency and utilization, and predict it')
+    sub = parser.add_subparsers(dest='command', required=True)
+    fitting = sub.add_parser('fit', help='Fit a model to the indexed runs')
+    fitting.add_argument('-o', '--output', default=MODEL_PATH, help='Model JSON file')
+    fitting.add_argument('-w', '--window', type=float, default=1.0, help='Seconds averaged into one fit point')
+    fitting.add_argument('--index', default=INDEX_PATH, help='Run index database (see run_index.py)')
+    fitting.add_argument('--energy-dir', default=ENERGY_DIR, help='Directory scanned for runs missing from the index')
+    fitting.add_argument('--pattern', help='Glob of energy logs to use instead of the run index')
+    fitting.add_argument('--cv', action='store_true', help='Also report the leave-one-setting-out RMSE')
+    prediction = sub.add_parser('predict', help='Predict power for a grid of settings')
+    prediction.add_argument('model', nargs='?', default=MODEL_PATH, help='Model JSON file')
+    prediction.add_argument('-s', '--socket', type=int, required=True)
+    prediction.add_argument('-f', '--freq', required=True, help='Comma-separated core frequencies, e.g. 1.2GHz,2.0GHz')
+    prediction.add_argument('-u', '--util', required=True, help='Comma-separated utilizations (0.0 to 1.0)')
+    prediction.add_argument('--uncore', help='Comma-separated uncore frequencies, e.g. 1.8GHz')
+    args = parser.parse_args()
+
+    if args.command == 'fit':
+        runs = _selected_runs(args)
+        if not runs:
+            parser.error('no energy logs to fit')
+        joined = joined_runs(runs, args.window)
+        model = fit(joined, args.window)
+        if args.cv:
+            for socket, rmse in cross_validate(joined, args.window).items():
+                model['sockets'][socket]['cv_rmse'] = rmse
+        with open(args.output, 'w') as f:
+            json.dump(model, f, indent=2)
+        for socket, fitted in model['sockets'].items():
+            print(f"Socket {socket}: {fitted['n']} points, RMSE {fitted['rmse']:.2f} W, R^2 {fitted['r2']:.3f}"
+                  + (f", held-out RMSE {fitted['cv_rmse']:.2f} W" if 'cv_rmse' in fitted else ''))
+    else:
+        with open(args.model) as f:
+            model = json.load(f)
+        model['sockets'] = {int(s): fitted for s, fitted in model['sockets'].items()}
+        freqs = [freq_ghz(f) for f in args.freq.split(',')]
+        utils = [float(u) for u in args.util.split(',')]
+        uncores = [freq_ghz(u) for u in args.uncore.split(',')] if args.uncore else [None]
+        rows = []
+        for freq, util, uncore in itertools.product(freqs, utils, uncores):
+            mean, low, high = predict(model, args.socket, freq, util, uncore)
+            rows.append({'freq_ghz': freq, 'util': util, 'uncore_ghz': uncore,
+                         'power_w': float(mean), 'low_w': float(low), 'high_w': float(high)})
+        pd.DataFrame(rows).to_csv(sys.stdout, index=False)
+
+if __name__ == '__main__':
+    main()
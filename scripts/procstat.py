@@ -0,0 +1,71 @@
+import os
+import numpy as np
+
+PROC_STAT = '/proc/stat'
+
+# Per-CPU jiffy counters in /proc/stat, in file order.  guest and guest_nice
+# are already included in user and nice, so they are left out.
+FIELDS = ['user', 'nice', 'system', 'idle', 'iowait', 'irq', 'softirq', 'steal']
+
+BREAKDOWN = ['user', 'system', 'irq', 'idle']
+
+def read_cpu_times(fd):
+    """Return an array of per-CPU counters indexed by CPU id, from one read of /proc/stat."""
+    os.lseek(fd, 0, os.SEEK_SET)
+    data = b''
+    # The per-CPU lines come first; stop reading once the intr line shows up
+    while b'\nintr' not in data:
+        chunk = os.read(fd, 65536)
+        if not chunk:
+            break
+        data += chunk
+    rows = {}
+    for line in data.split(b'\n'):
+        if not line.startswith(b'cpu'):
+            if rows:
+                break
+            continue
+        parts = line.split()
+        if parts[0] == b'cpu':
+            continue
+        rows[int(parts[0][3:])] = parts[1:1 + len(FIELDS)]
+    times = np.zeros((max(rows) + 1, len(FIELDS)), dtype=np.int64)
+    for cpu, values in rows.items():
+        times[cpu] = [int(v) for v in values]
+    return times
+
+class CpuStatSampler:
+    """Utilization of a set of cores, all measured over the same window.
+
+    Every read() takes a single snapshot of /proc/stat and computes the
+    utilization of all requested cores from the difference to the previous
+    snapshot, so each row covers exactly the time since the previous row.
+    """
+
+    def __init__(self, cores, path=PROC_STAT):
+        self.cores = np.array(cores)
+        self._fd = os.open(path, os.O_RDONLY)
+        self._prev = read_cpu_times(self._fd)[self.cores]
+
+    def read(self):
+        """Return a dict of percentage arrays: total plus the BREAKDOWN categories."""
+        cur = read_cpu_times(self._fd)[self.cores]
+        delta = (cur - self._prev).astype(np.float64)
+        self._prev = cur
+        d = dict(zip(FIELDS, delta.T))
+        elapsed = delta.sum(axis=1)
+        parts = {
+            'user': d['user'] + d['nice'],
+            'system': d['system'],
+            'irq': d['irq'] + d['softirq'],
+            'idle': d['idle'] + d['iowait'],
+        }
+        parts['total'] = elapsed - parts['idle']
+        result = {}
+        for name, jiffies in parts.items():
+            result[name] = np.zeros(len(self.cores))
+            np.divide(jiffies * 100, elapsed, out=result[name], where=elapsed > 0)
+        return result
+
+    def close(self):
+        os.close(self._fd)
@@ -0,0 +1,83 @@
+import os
+import re
+from collections import namedtuple
+
+POWERCAP_ROOT = '/sys/class/powercap'
+
+RaplZone = namedtuple('RaplZone', ['id', 'name', 'path', 'max_energy_range_uj'])
+
+def _read_sysfs(path):
+    with open(path) as f:
+        return f.read().strip()
+
+def discover_zones(root=POWERCAP_ROOT, subzones=False):
+    """Return the RAPL zones under a powercap tree, ordered by zone id.
+
+    Zone ids follow the sysfs naming, e.g. '0' for intel-rapl:0 and '0:1' for
+    its second subzone.  Subzones are only returned when requested.
+    """
+    zones = []
+    for entry in os.listdir(root):
+        match = re.fullmatch(r'intel-rapl:(\d+(?::\d+)*)', entry)
+        if not match:
+            continue
+        zone_id = match.group(1)
+        if ':' in zone_id and not subzones:
+            continue
+        path = os.path.join(root, entry)
+        zones.append(RaplZone(
+            id=zone_id,
+            name=_read_sysfs(os.path.join(path, 'name')),
+            path=path,
+            max_energy_range_uj=int(_read_sysfs(os.path.join(path, 'max_energy_range_uj'))),
+        ))
+    zones.sort(key=lambda z: [int(x) for x in z.id.split(':')])
+    return zones
+
+def column_name(zone):
+    """CSV column name for a zone, e.g. energy_zone_0 or energy_zone_0_1."""
+    return 'energy_zone_' + zone.id.replace(':', '_')
+
+def zone_meta(zones):
+    """Per-column description of zones for a log's metadata: id, name, wrap range and unit."""
+    return {column_name(z): {'id': z.id, 'name': z.name, 'max_energy_range_uj': z.max_energy_range_uj,
+                             'unit': 'uJ'} for z in zones}
+
+def energy_delta(prev, cur, max_range):
+    """Energy consumed between two counter readings, accounting for wraparound."""
+    delta = cur - prev
+    if delta < 0:
+        delta += max_range
+    return delta
+
+class RaplSampler:
+    """Reads RAPL energy counters from sysfs through file descriptors kept open.
+
+    Each read is a single pread() per zone, so sampling costs a few syscalls
+    instead of a process spawn.  Reading energy_uj usually requires root.
+    """
+
+    def __init__(self, zones):
+        self.zones = list(zones)
+        self._fds = []
+        try:
+            for zone in self.zones:
+                self._fds.append(os.open(os.path.join(zone.path, 'energy_uj'), os.O_RDONLY))
+        except OSError:
+            self.close()
+            raise
+
+    def read(self):
+        """Return the current energy counter of every zone in microjoules."""
+        return [int(os.pread(fd, 32, 0)) for fd in self._fds]
+
+    def close(self):
+        for fd in self._fds:
+            os.close(fd)
+        self._fds = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,200 @@
+import os
+import re
+import glob
+import json
+import time
+import hashlib
+import sqlite3
+import argparse
+from paths import side_paths
+from power_analysis import load_phases, parse_run_name
+
+INDEX_PATH = '../data/runs.sqlite'
+ENERGY_DIR = '../data/energy'
+
+# Energy logs as named by power_experiment.run_sweep_point(), without side files
+RUN_LOG = re.compile(r'energy_socket\d+-[^_]+_util-[\d.e-]+_run-\d+\.(csv|bin)')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT UNIQUE NOT NULL,
+    path TEXT UNIQUE NOT NULL,
+    node TEXT,
+    passive_socket INTEGER,
+    freq TEXT,
+    freq_ghz REAL,
+    utilization REAL,
+    run INTEGER,
+    params TEXT,
+    start REAL,
+    end REAL,
+    recorded REAL
+);
+CREATE INDEX IF NOT EXISTS runs_setting ON runs (passive_socket, freq_ghz, utilization);
+CREATE TABLE IF NOT EXISTS files (
+    run_id TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER,
+    mtime_ns INTEGER,
+    sha256 TEXT,
+    PRIMARY KEY (run_id, path)
+);
+CREATE TABLE IF NOT EXISTS consumers (
+    name TEXT PRIMARY KEY,
+    last_id INTEGER NOT NULL
+);
+'''
+
+# Run parameters that have their own column and can be queried directly
+COLUMNS = ['run_id', 'path', 'node', 'passive_socket', 'freq', 'freq_ghz', 'utilization', 'run', 'start', 'end']
+
+def freq_ghz(freq):
+    """Numeric value of a frequency setting such as '1.2GHz' or '800MHz', in GHz."""
+    if freq.endswith('GHz'):
+        return float(freq[:-3])
+    if freq.endswith('MHz'):
+        return float(freq[:-3]) / 1000
+    return float(freq)
+
+def run_logs(pattern):
+    """Energy logs matching a glob pattern, sorted, without the side files recorded alongside them.
+
+    Side files such as energy_<id>.util.csv match the usual run globs too,
+    so every glob over the energy directory goes through RUN_LOG.
+    """
+    return sorted(p for p in glob.glob(pattern) if RUN_LOG.fullmatch(os.path.basename(p)))
+
+def checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def side_files(path):
+    """The files recorded alongside an energy log that exist."""
+    return [p for p in side_paths(path) if os.path.exists(p)]
+
+class RunIndex:
+    """Append-only SQLite index of experiment runs and the files they produced.
+
+    Every run is one row keyed by its point id (see sweep.point_id) with its
+    parameters in indexed columns, so selecting runs never touches the data
+    directory.  Re-recording a run replaces its row with a new id, which
+    makes it show up again in new_runs().
+    """
+
+    def __init__(self, path=INDEX_PATH):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(self, path, files=(), node=None, params=None):
+        """Add the run whose energy log is path, with its side files and parameters.
+
+        Parameters not given are parsed from the file name, and the start
+        and end come from the phase record when there is one.
+        """
+        params = dict(parse_run_name(path), **(params or {}))
+        run_id = os.path.splitext(os.path.basename(path))[0][len('energy_'):]
+        phases = load_phases(path)
+        start = end = None
+        if phases:
+            start = min(s for s, _ in phases.values())
+            end = max(e for _, e in phases.values())
+        with self.db:
+            self.db.execute('DELETE FROM files WHERE run_id = ?', (run_id,))
+            self.db.execute(
+                'INSERT OR REPLACE INTO runs (run_id, path, node, passive_socket, freq, freq_ghz, utilization, run,'
+                ' params, start, end, recorded) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (run_id, os.path.abspath(path), node, params['passive_socket'], params['freq'],
+                 freq_ghz(params['freq']), params['utilization'], params['run'], json.dumps(params),
+                 start, end, time.time()))
+            for f in [path] + [f for f in files if f != path]:
+                stat = os.stat(f)
+                self.db.execute('INSERT INTO files VALUES (?, ?, ?, ?, ?)',
+                                (run_id, os.path.abspath(f), stat.st_size, stat.st_mtime_ns, checksum(f)))
+        return run_id
+
+    def query(self, **where):
+        """Runs matching column=value conditions (see COLUMNS), ordered by setting and run."""
+        unknown = set(where) - set(COLUMNS)
+        if unknown:
+            raise ValueError(f'Cannot query runs by {sorted(unknown)}')
+        clause = ' AND '.join(f'"{column}" = ?' for column in where)
+        sql = 'SELECT * FROM runs' + (f' WHERE {clause}' if clause else '')
+        sql += ' ORDER BY passive_socket, freq_ghz, utilization, run'
+        return self.db.execute(sql, list(where.values())).fetchall()
+
+    def values(self, column):
+        """Distinct values of a column, frequencies ordered numerically."""
+        if column not in COLUMNS:
+            raise ValueError(f'Unknown run column {column}')
+        order = 'freq_ghz' if column == 'freq' else f'"{column}"'
+        return [row[0] for row in
+                self.db.execute(f'SELECT "{column}" FROM runs GROUP BY "{column}" ORDER BY MIN({order})')]
+
+    def files(self, run_id):
+        return self.db.execute('SELECT * FROM files WHERE run_id = ?', (run_id,)).fetchall()
+
+    def new_runs(self, consumer):
+        """Runs recorded since consumer last called mark_processed()."""
+        row = self.db.execute('SELECT last_id FROM consumers WHERE name = ?', (consumer,)).fetchone()
+        return self.db.execute('SELECT * FROM runs WHERE id > ? ORDER BY id', (row[0] if row else 0,)).fetchall()
+
+    def mark_processed(self, consumer, runs):
+        """Remember that consumer has processed runs, as returned by new_runs()."""
+        if runs:
+            with self.db:
+                self.db.execute('INSERT OR REPLACE INTO consumers VALUES (?, ?)',
+                                (consumer, max(run['id'] for run in runs)))
+
+    def scan(self, directory=ENERGY_DIR):
+        """Record energy logs in directory that the index does not know yet; return how many.
+
+        Logs already indexed cost one set lookup, so the scan does not slow
+        down with the size of the archive beyond listing the directory.
+        """
+        known = {row[0] for row in self.db.execute('SELECT path FROM runs')}
+        added = 0
+        for entry in os.scandir(directory):
+            if not RUN_LOG.fullmatch(entry.name) or os.path.abspath(entry.path) in known:
+                continue
+            self.record(entry.path, side_files(entry.path))
+            added += 1
+        return added
+
+def main():
+    parser = argparse.ArgumentParser(prog='run_index')
+    parser.add_argument('--index', default=INDEX_PATH, help='Run index database')
+    sub = parser.add_subparsers(dest='command', required=True)
+    scan = sub.add_parser('scan', help='Index energy logs that are not indexed yet')
+    scan.add_argument('directory', nargs='?', default=ENERGY_DIR)
+    query = sub.add_parser('query', help='List runs, e.g. query freq=1.2GHz utilization=0.5')
+    query.add_argument('conditions', nargs='*', help='column=value')
+    args = parser.parse_args()
+
+    with RunIndex(args.index) as index:
+        if args.command == 'scan':
+            print(f'{index.scan(args.directory)} runs added')
+        else:
+            where = {}
+            for condition in args.conditions:
+                column, value = condition.split('=', 1)
+                where[column] = value if column in ('run_id', 'path', 'node', 'freq') else float(value)
+            for run in index.query(**where):
+                print(json.dumps({column: run[column] for column in COLUMNS}))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+import sys
+import time
+
+# --start-at value that takes the start time from node_agent.py's handshake
+START_SYNC = 'sync'
+
+def wait_until(deadline):
+    """Sleep until a time.monotonic() deadline; CLOCK_MONOTONIC is shared by all processes."""
+    now = time.monotonic()
+    if deadline > now:
+        time.sleep(deadline - now)
+
+def start_at_arg(value):
+    """argparse type of --start-at: a time.monotonic() value or START_SYNC."""
+    return value if value == START_SYNC else float(value)
+
+def add_start_argument(parser):
+    """Add the --start-at option shared by the loggers and busy_loop.py to an argparse parser."""
+    parser.add_argument('--start-at', type=start_at_arg,
+                      help='time.monotonic() value at which to start, or sync to get it from node_agent.py')
+
+def resolve_start(start_at):
+    """time.monotonic() start time for a --start-at value.
+
+    With START_SYNC this is node_agent.py's handshake: the process prints
+    `ready` once it has set up, then reads the start time the agent sends
+    on stdin when every process of the experiment is ready.
+    """
+    if start_at != START_SYNC:
+        return start_at
+    print('ready', flush=True)
+    return float(sys.stdin.readline())
+
+def report_started(started=None):
+    """Tell node_agent.py the time.monotonic() time the process actually started (default: now)."""
+    print(f'started {time.monotonic() if started is None else started!r}', flush=True)
+
+def fixed_rate_ticks(interval, duration=None, start_at=None):
+    """Yield (tick, wall-clock timestamp) pairs on a fixed-rate schedule.
+
+    Deadlines are computed as start + tick * interval on the monotonic clock
+    rather than from the previous sample, so time spent sampling does not
+    accumulate as drift.  If the caller falls behind by more than a tick, the
+    missed ticks are skipped instead of being replayed back to back, so tick
+    numbers may jump.  An interval of 0 samples as fast as the caller
+    consumes the generator.  With start_at, the schedule starts at that
+    time.monotonic() value instead of immediately.
+    """
+    if start_at is not None:
+        wait_until(start_at)
+    start = time.monotonic() if start_at is None else start_at
+    tick = 0
+    while True:
+        now = time.monotonic()
+        if interval > 0:
+            deadline = start + tick * interval
+            if deadline > now:
+                time.sleep(deadline - now)
+            elif now - deadline >= interval:
+                # Skip ticks we missed entirely
+                tick += int((now - deadline) // interval)
+            if duration is not None and tick * interval >= duration:
+                return
+        elif duration is not None and now - start >= duration:
+            return
+        yield tick, time.time()
+        tick += 1
+
+def fixed_rate(interval, duration=None, start_at=None):
+    """Yield wall-clock timestamps on a fixed-rate schedule, see fixed_rate_ticks()."""
+    for _, timestamp in fixed_rate_ticks(interval, duration, start_at):
+        yield timestamp
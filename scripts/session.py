@@ -0,0 +1,148 @@
+import os
+import threading
+from tracing import TracedAgent, span
+
+BATCH_MARKER = "__power_exp_batch__"
+
+class CommandRecorder:
+    """Stand-in for a CloudLabAgent that records the commands its helpers run instead of running them.
+
+    Calling an agent helper such as set_frequency() with a recorder as self
+    collects the commands the helper sends through run_on_node(), so they
+    can be sent in a batch.  The helpers see the real agent's data
+    attributes but none of its other methods, so recording never has side
+    effects; a helper that calls one fails instead.
+    """
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.commands = []
+
+    def run_on_node(self, node, cmd, *args, **kwargs):
+        self.commands.append(cmd)
+        return [], "", 0
+
+    def __getattr__(self, name):
+        attr = getattr(self.agent, name)
+        if callable(attr):
+            raise AttributeError(f"{name} is not available while recording commands")
+        return attr
+
+class NodeSession:
+    """Command batching and fact caching for one node of a CloudLabAgent.
+
+    Connections are owned by the agent; the session cuts the number of
+    round-trips over them by sending independent commands as one script and
+    by remembering facts that do not change while the experiment runs, such
+    as the CPU topology.  It does not open connections of its own, so every
+    run() or run_batch() is one agent call over a connection the agent
+    manages; the session does not multiplex or keep connections open.
+    setup() sends an experiment's preparation and frequency settings as
+    one batch, which is a single round-trip as long as the agent's helpers
+    run their commands through run_on_node() (see helper_commands()).  With a tracing.Tracer, span()
+    times orchestration steps on the node; pass a tracing.TracedAgent as cl
+    to trace the remote commands as well.
+    """
+
+    def __init__(self, node, cl, tracer=None):
+        self.node = node
+        self.cl = cl
+        self.tracer = tracer
+        self._facts = {}
+        self._lock = threading.Lock()
+
+    def run(self, cmd):
+        """Run one command; return (stdout, stderr, exit_status) like run_on_node."""
+        return self.cl.run_on_node(self.node, cmd)
+
+    def run_batch(self, cmds, check=True):
+        """Run independent commands in a single round-trip.
+
+        Every command runs in its own subshell, so a failing command does not
+        stop the others.  Returns one (output lines, exit_status) pair per
+        command, with stdout and stderr merged.  With check set, raises if
+        any command failed.
+        """
+        script = []
+        for i, cmd in enumerate(cmds):
+            script.append(f"echo {BATCH_MARKER} begin {i}")
+            script.append(f"( {cmd} ) 2>&1")
+            script.append(f"echo {BATCH_MARKER} end {i} $?")
+        stdout, stderr, _ = self.run("\n".join(script))
+
+        results = [([], None) for _ in cmds]
+        current = None
+        for line in stdout:
+            parts = line.split()
+            if parts[:1] == [BATCH_MARKER]:
+                if parts[1] == "begin":
+                    current = int(parts[2])
+                else:
+                    results[int(parts[2])] = (results[int(parts[2])][0], int(parts[3]))
+                    current = None
+            elif current is not None:
+                results[current][0].append(line)
+
+        if check:
+            for cmd, (output, status) in zip(cmds, results):
+                if status != 0:
+                    raise Exception(f"'{cmd}' failed on {self.node} ({status}): {''.join(output) or stderr}")
+        return results
+
+    def span(self, name, **args):
+        """Context manager timing a step on this node, see tracing.Tracer.span()."""
+        return span(self.tracer, name, self.node, **args)
+
+    def helper_commands(self, name, *args):
+        """The commands the agent helper `name` runs on this node, or None if it runs none through run_on_node()."""
+        agent = self.cl.agent if isinstance(self.cl, TracedAgent) else self.cl
+        recorder = CommandRecorder(agent)
+        try:
+            getattr(type(agent), name)(recorder, self.node, *args)
+        except Exception:
+            # The helper uses other agent methods or needs the real output
+            return None
+        return recorder.commands or None
+
+    def setup(self, prepare, socket_cores, socket_freqs, governor="userspace"):
+        """Run the `prepare` commands, then set the cpufreq governor and every socket's frequency, in one batch.
+
+        The governor and frequencies are set with the commands of the agent's
+        set_power_governor() and set_frequency() helpers.  A helper that
+        runs no command through run_on_node() is called directly after the
+        batch instead, at the cost of its own round-trips.
+        """
+        calls = [("set_power_governor", governor)]
+        calls += [("set_frequency", ",".join(map(str, cores)), socket_freqs[socket])
+                  for socket, cores in socket_cores.items()]
+        cmds, direct = list(prepare), []
+        for name, *args in calls:
+            recorded = self.helper_commands(name, *args)
+            if recorded is None:
+                direct.append((name, args))
+            else:
+                cmds += recorded
+        if cmds:
+            self.run_batch(cmds)
+        for name, args in direct:
+            getattr(self.cl, name)(self.node, *args)
+
+    def fetch(self, remote_paths, local_dir):
+        """Copy text files from the node into local_dir in a single round-trip; returns the local paths."""
+        # sed adds a final newline where one is missing, so the batch markers stay on their own lines
+        results = self.run_batch([f"sed -e '$a\\' {path}" for path in remote_paths])
+        os.makedirs(local_dir, exist_ok=True)
+        local_paths = []
+        for path, (lines, _) in zip(remote_paths, results):
+            local_paths.append(os.path.join(local_dir, os.path.basename(path)))
+            with open(local_paths[-1], "w") as f:
+                for line in lines:
+                    f.write(line.rstrip("\n") + "\n")
+        return local_paths
+
+    def cached(self, key, compute):
+        """Return a per-node fact, computing it on first use."""
+        with self._lock:
+            if key not in self._facts:
+                self._facts[key] = compute()
+            return self._facts[key]
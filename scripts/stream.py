@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import socket
+import asyncio
+import selectors
+import threading
+from collections import deque
+
+def parse_address(address):
+    """Parse 'unix:/path', 'tcp:host:port' or 'tcp:port' into (family, sockaddr)."""
+    kind, _, rest = address.partition(':')
+    if kind == 'unix':
+        return socket.AF_UNIX, rest
+    if kind == 'tcp':
+        host, _, port = rest.rpartition(':')
+        return socket.AF_INET, (host or '0.0.0.0', int(port))
+    raise ValueError(f'Unknown stream address {address}, expected unix:<path> or tcp:[host:]port')
+
+class StreamPublisher:
+    """Serves samples to any number of clients without ever blocking the sampler.
+
+    publish() only appends to a bounded ring buffer; when the buffer is full
+    the oldest message is dropped and counted.  A background thread accepts
+    clients and sends them newline-delimited JSON with non-blocking sockets.
+    A client that falls more than `client_limit` bytes behind loses messages
+    instead of slowing anyone down.
+    """
+
+    def __init__(self, address, capacity=4096, client_limit=1 << 20):
+        self.ring = deque(maxlen=capacity)
+        self.published = 0
+        self.client_limit = client_limit
+        self.dropped = 0
+        family, sockaddr = parse_address(address)
+        if family == socket.AF_UNIX and os.path.exists(sockaddr):
+            os.unlink(sockaddr)
+        self.server = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(sockaddr)
+        self.server.listen()
+        self.server.setblocking(False)
+        self.clients = {}
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.server, selectors.EVENT_READ)
+        self.stopping = False
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def publish(self, message):
+        if len(self.ring) == self.ring.maxlen:
+            self.dropped += 1
+        self.ring.append(message)
+        self.published += 1
+
+    def _serve(self):
+        while not self.stopping:
+            for key, _ in self.selector.select(timeout=0.05):
+                if key.fileobj is self.server:
+                    try:
+                        client, _ = self.server.accept()
+                    except BlockingIOError:
+                        continue
+                    client.setblocking(False)
+                    self.clients[client] = bytearray()
+            self._drain()
+
+    def _drain(self):
+        lines = []
+        while self.ring:
+            lines.append(json.dumps(self.ring.popleft()) + '\n')
+        data = ''.join(lines).encode()
+        for client, pending in list(self.clients.items()):
+            if len(pending) + len(data) <= self.client_limit:
+                pending += data
+            else:
+                self.dropped += 1
+            try:
+                sent = client.send(pending)
+                del pending[:sent]
+            except BlockingIOError:
+                pass
+            except OSError:
+                client.close()
+                del self.clients[client]
+
+    def close(self):
+        self.stopping = True
+        self.thread.join()
+        self._drain()
+        for client in self.clients:
+            client.close()
+        self.selector.close()
+        self.server.close()
+
+class StreamSink:
+    """Collector sink that publishes each sample as {probe, seq, timestamp, values}."""
+
+    def __init__(self, publisher, name, columns):
+        self.publisher = publisher
+        self.name = name
+        self.columns = list(columns)
+
+    def write(self, seq, timestamp, values):
+        self.publisher.publish({'probe': self.name, 'seq': seq, 'timestamp': timestamp,
+                                'values': dict(zip(self.columns, values))})
+
+    def close(self):
+        pass
+
+async def read_stream(address, handle):
+    """Connect to a publisher and call handle(message) for every message until it closes."""
+    family, sockaddr = parse_address(address)
+    if family == socket.AF_UNIX:
+        reader, writer = await asyncio.open_unix_connection(sockaddr)
+    else:
+        reader, writer = await asyncio.open_connection(*sockaddr)
+    try:
+        async for line in reader:
+            handle(json.loads(line))
+    finally:
+        writer.close()
+
+class RollingView:
+    """Rolling per-source view of live samples: power from energy counters, latest other values."""
+
+    def __init__(self, window=5.0):
+        self.window = window
+        self.energy = {}
+        self.latest = {}
+
+    def handle(self, source, message):
+        if message['probe'] == 'energy':
+            history = self.energy.setdefault(source, deque())
+            history.append((message['timestamp'], message['values']))
+            while history[-1][0] - history[0][0] > self.window:
+                history.popleft()
+        else:
+            self.latest.setdefault(source, {}).update(message['values'])
+
+    def power(self, source):
+        """Mean power per zone in watts over the rolling window."""
+        history = self.energy.get(source)
+        if not history or len(history) < 2:
+            return {}
+        (t0, first), (t1, last) = history[0], history[-1]
+        # Skip zones whose counter wrapped inside the window
+        return {zone: (last[zone] - first[zone]) / (t1 - t0) / 1e6
+                for zone in last if last[zone] >= first[zone]}
+
+    def status(self, source):
+        parts = [f'{zone[len("energy_zone_"):]}={watts:.1f}W' for zone, watts in sorted(self.power(source).items())]
+        latest = self.latest.get(source, {})
+        # Per-core frequencies are shown as their mean
+        freqs = [value for name, value in latest.items() if name.startswith('core_') and name.endswith('_freq')]
+        if freqs:
+            parts.append(f'freq={sum(freqs) / len(freqs):.0f}MHz')
+        parts += [f'{name}={value:.0f}' for name, value in sorted(latest.items())
+                  if not (name.startswith('core_') and name.endswith('_freq'))]
+        return f'{source}: ' + ' '.join(parts)
+
+async def watch(sources, interval=1.0, window=5.0, stop=None):
+    """Follow several publishers and print a rolling status line per source.
+
+    sources maps a name to an address or a list of addresses, e.g. the
+    energy and frequency loggers of one node, whose samples share the line.
+    Connections are retried until `stop` (a threading.Event) is set, so
+    watching can start before the loggers do.
+    """
+    view = RollingView(window)
+
+    async def follow(name, address):
+        while not (stop and stop.is_set()):
+            try:
+                await read_stream(address, lambda m: view.handle(name, m))
+            except OSError:
+                pass
+            await asyncio.sleep(0.5)
+
+    tasks = [asyncio.create_task(follow(name, address)) for name, addresses in sources.items()
+             for address in ([addresses] if isinstance(addresses, str) else addresses)]
+    try:
+        while not (stop and stop.is_set()):
+            await asyncio.sleep(interval)
+            for name in sources:
+                print(view.status(name), flush=True)
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,116 @@
+import os
+import json
+import time
+import queue
+import itertools
+import threading
+from paths import util_label
+from tracing import span
+
+def point_id(point):
+    """Name of a sweep point, matching the energy_<id>.csv files the plots read."""
+    return (f"socket{point['passive_socket']}-{point['freq']}"
+            f"_util-{util_label(point['utilization'])}_run-{point['run']}")
+
+def expand_grid(grid):
+    """Expand a parameter grid into a list of sweep points.
+
+    The grid is a dictionary with lists for passive_socket, freq and
+    utilization, the number of runs per combination, and scalar settings
+    (e.g. active_freq, duration) that are copied into every point.
+    Raises ValueError if two points would get the same id.
+    """
+    grid = dict(grid)
+    sockets = grid.pop('passive_socket')
+    freqs = grid.pop('freq')
+    utilizations = grid.pop('utilization')
+    runs = grid.pop('runs', 1)
+    points = []
+    for socket, freq, util, run in itertools.product(sockets, freqs, utilizations, range(runs)):
+        point = dict(grid, passive_socket=socket, freq=freq, utilization=util, run=run)
+        point['id'] = point_id(point)
+        points.append(point)
+    ids = [point['id'] for point in points]
+    duplicates = sorted({i for i in ids if ids.count(i) > 1})
+    if duplicates:
+        raise ValueError(f"grid has duplicate points: {', '.join(duplicates)}")
+    return points
+
+def load_state(path):
+    """Return the ids of the points already completed according to a state file."""
+    done = set()
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Partially written last line of an interrupted sweep
+                    continue
+                if entry['status'] == 'done':
+                    done.add(entry['id'])
+    return done
+
+class SweepState:
+    """Append-only JSON-lines record of sweep progress, safe to share between workers."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def record(self, point, node, status, attempt, **extra):
+        entry = dict(id=point['id'], node=node, status=status, attempt=attempt, time=time.time(), **extra)
+        with self.lock, open(self.path, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+
+def run_sweep(points, nodes, run_point, state_path, cooldown=30, retries=2, tracer=None):
+    """Run sweep points on several nodes concurrently.
+
+    Each node gets one worker that takes the next pending point from a
+    shared queue, calls run_point(node, point) and then lets the node cool
+    down for `cooldown` seconds before its next point.  A point whose
+    run_point raises is put back on the queue, to be retried on any node,
+    up to `retries` more times.  Completed points are recorded in the state
+    file and skipped when the sweep is restarted.
+
+    With a tracing.Tracer, every point and cooldown is recorded as a span
+    on its node.
+
+    Returns the list of points that failed on every attempt.
+    """
+    state = SweepState(state_path)
+    done = load_state(state_path)
+    pending = queue.Queue()
+    for point in points:
+        if point['id'] not in done:
+            pending.put((point, 0))
+    print(f"Sweep: {pending.qsize()} of {len(points)} points pending on {len(nodes)} nodes")
+
+    failed = []
+    def worker(node):
+        while True:
+            try:
+                point, attempt = pending.get_nowait()
+            except queue.Empty:
+                return
+            print(f"[{node}] Running {point['id']} (attempt {attempt + 1})")
+            try:
+                with span(tracer, 'point', node, point=point['id'], attempt=attempt):
+                    run_point(node, point)
+                state.record(point, node, 'done', attempt)
+            except Exception as e:
+                print(f"[{node}] {point['id']} failed: {e}")
+                state.record(point, node, 'failed', attempt, error=str(e))
+                if attempt < retries:
+                    pending.put((point, attempt + 1))
+                else:
+                    failed.append(point)
+            with span(tracer, 'cooldown', node):
+                time.sleep(cooldown)
+
+    threads = [threading.Thread(target=worker, args=(node,)) for node in nodes]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return failed
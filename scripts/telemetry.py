@@ -0,0 +1,334 @@
+import os
+import csv
+import argparse
+from adaptive import AdaptiveSink, add_adaptive_arguments, adaptive_options, write_meta
+from binlog import BinaryLogWriter
+from corefreq import AperfMperfFreq, CpupowerFreq, ScalingCurFreq
+from msr import (MSR_DEV_ROOT, MSR_UNCORE_PERF_STATUS, MSR_UNCORE_RATIO_LIMIT,
+                 FakeMsrBackend, MsrBackend, MsrReader, uncore_current_freq, uncore_ratio_limits)
+from paths import meta_path, side_path
+from procstat import BREAKDOWN, PROC_STAT, CpuStatSampler
+from rapl import POWERCAP_ROOT, RaplSampler, column_name, discover_zones, zone_meta
+from sampling import START_SYNC, add_start_argument, fixed_rate_ticks, report_started, resolve_start
+from stream import StreamPublisher, StreamSink
+from topology import SYSFS_CPU_ROOT, socket_representatives
+
+class EnergyProbe:
+    """RAPL energy counters in microjoules, one column per zone."""
+
+    name = 'energy'
+    dtype = 'u8'
+    kind = 'counter'
+    needs_baseline = False
+
+    def __init__(self, num_sockets=None, subzones=False, root=POWERCAP_ROOT):
+        zones = discover_zones(root, subzones=subzones)
+        if num_sockets is not None:
+            zones = [z for z in zones if int(z.id.split(':')[0]) < num_sockets]
+        self.zones = zones
+        self.columns = [column_name(z) for z in zones]
+        self.sampler = RaplSampler(zones)
+
+    def meta(self):
+        """Wrap range and unit of every zone, recorded with the log (see power_analysis.zone_ranges())."""
+        return {'zones': zone_meta(self.zones)}
+
+    def sample(self):
+        return self.sampler.read()
+
+    def close(self):
+        self.sampler.close()
+
+class CoreFreqProbe:
+    """Per-core frequency in MHz from one of the corefreq engines."""
+
+    name = 'freq'
+    kind = 'level'
+    dtype = 'f8'
+
+    def __init__(self, cores, backend='aperf', base_mhz=None, msr_backend=None, sysfs_root=SYSFS_CPU_ROOT):
+        if backend == 'aperf':
+            self.engine = AperfMperfFreq(cores, msr_backend, base_mhz)
+        elif backend == 'scaling':
+            self.engine = ScalingCurFreq(cores, sysfs_root)
+        else:
+            self.engine = CpupowerFreq(cores)
+        # APERF/MPERF frequencies are averages since the previous read
+        self.needs_baseline = backend == 'aperf'
+        self.columns = [f'core_{core}_freq' for core in cores]
+
+    def sample(self):
+        return self.engine.read().tolist()
+
+    def close(self):
+        self.engine.close()
+
+class UncoreFreqProbe:
+    """Current, minimum and maximum uncore frequency in MHz of every socket."""
+
+    name = 'uncore'
+    kind = 'level'
+    dtype = 'u8'
+    needs_baseline = False
+
+    def __init__(self, extra_msrs=(), msr_backend=None, sysfs_root=SYSFS_CPU_ROOT):
+        cpus = socket_representatives(sysfs_root)
+        regs = [MSR_UNCORE_PERF_STATUS, MSR_UNCORE_RATIO_LIMIT] + list(extra_msrs)
+        self.reader = MsrReader(cpus, regs, msr_backend)
+        self.columns = []
+        for socket in range(len(cpus)):
+            self.columns += [f'uncore_freq_{socket}', f'uncore_min_freq_{socket}', f'uncore_max_freq_{socket}']
+            self.columns += [f'msr_{reg:#x}_{socket}' for reg in extra_msrs]
+
+    def sample(self):
+        row = []
+        for status, limit, *extra in self.reader.read():
+            row += [uncore_current_freq(status), *uncore_ratio_limits(limit), *extra]
+        return row
+
+    def close(self):
+        self.reader.close()
+
+class UtilizationProbe:
+    """Per-core utilization in percent, optionally with a user/system/irq/idle breakdown."""
+
+    name = 'util'
+    kind = 'level'
+    dtype = 'f8'
+    needs_baseline = True
+
+    def __init__(self, cores, breakdown=False, path=PROC_STAT):
+        self.sampler = CpuStatSampler(cores, path)
+        self.breakdown = breakdown
+        self.columns = [f'cpu_core_{core}' for core in cores]
+        if breakdown:
+            self.columns += [f'cpu_core_{core}_{part}' for part in BREAKDOWN for core in cores]
+
+    def sample(self):
+        util = self.sampler.read()
+        row = util['total'].tolist()
+        if self.breakdown:
+            for part in BREAKDOWN:
+                row += util[part].tolist()
+        return row
+
+    def close(self):
+        self.sampler.close()
+
+class CsvSink:
+    """Writes one CSV row per sample: timestamp, the probe's columns and optionally seq."""
+
+    def __init__(self, filename, columns, seq=False):
+        # Block-buffered; rows reach the file when the buffer fills or on close
+        self.file = open(filename, 'w', newline='', buffering=65536)
+        self.writer = csv.writer(self.file)
+        self.seq = seq
+        self.writer.writerow(['timestamp'] + list(columns) + (['seq'] if seq else []))
+
+    def write(self, seq, timestamp, values):
+        self.writer.writerow([timestamp] + values + ([seq] if self.seq else []))
+
+    def close(self):
+        self.file.close()
+
+class BinarySink:
+    """Writes samples to a binlog file with the same columns as CsvSink."""
+
+    def __init__(self, filename, columns, dtype='f8', seq=False, meta=None):
+        layout = [('timestamp', 'f8')] + [(c, dtype) for c in columns] + ([('seq', 'u8')] if seq else [])
+        self.writer = BinaryLogWriter(filename, layout, meta)
+        self.seq = seq
+
+    def write(self, seq, timestamp, values):
+        self.writer.write([timestamp] + values + ([seq] if self.seq else []))
+
+    def close(self):
+        self.writer.close()
+
+class TeeSink:
+    """Forwards every sample to several sinks, e.g. a file and a live stream."""
+
+    def __init__(self, sinks):
+        self.sinks = list(sinks)
+
+    def write(self, seq, timestamp, values):
+        for sink in self.sinks:
+            sink.write(seq, timestamp, values)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+def open_sink(filename, probe, fmt='csv', seq=False, adaptive=None, interval=None):
+    """Open a CSV or binary sink for a probe's samples.
+
+    Probes with a meta() method, such as EnergyProbe's wrap ranges, have it
+    written to the log's meta sidecar (see adaptive.write_meta()) and, for
+    binary logs, to the header too.  With adaptive options (see
+    adaptive.AdaptiveSink) only changes and heartbeats are written, with seq
+    and an n_samples column, and the options, base interval and column
+    kinds go to the sidecar as well.
+    """
+    columns = probe.columns + (['n_samples'] if adaptive else [])
+    seq = seq or bool(adaptive)
+    meta = probe.meta() if hasattr(probe, 'meta') else {}
+    if adaptive:
+        meta['adaptive'] = dict(adaptive, interval=interval, kinds={column: probe.kind for column in probe.columns})
+    if meta:
+        write_meta(filename, meta)
+    elif os.path.exists(meta_path(filename)):
+        # The sidecar of an earlier log of the same name no longer applies
+        os.remove(meta_path(filename))
+    if fmt == 'bin':
+        sink = BinarySink(filename, columns, probe.dtype, seq, meta)
+    else:
+        sink = CsvSink(filename, columns, seq)
+    if adaptive:
+        sink = AdaptiveSink(sink, [probe.kind] * len(probe.columns), **adaptive)
+    return sink
+
+class Collector:
+    """Drives several probes from one monotonic fixed-rate scheduler.
+
+    The scheduler ticks at the shortest probe interval and every probe is
+    sampled on the ticks that fall into its own interval, so samples taken on
+    the same tick share a timestamp and a sequence number (the tick index)
+    across all outputs.  Probes that report averages since their previous
+    read (needs_baseline) discard their first sample.
+    """
+
+    def __init__(self):
+        self.entries = []
+
+    def add(self, probe, interval, sink):
+        self.entries.append([probe, interval, sink, None])
+
+    def run(self, duration, core=None, start_at=None):
+        if core is not None:
+            os.sched_setaffinity(0, {core})
+        intervals = [entry[1] for entry in self.entries]
+        base = min(intervals)
+        if base == 0 and any(intervals):
+            raise ValueError('an interval of 0 cannot be combined with fixed intervals')
+        synced = start_at == START_SYNC
+        start_at = resolve_start(start_at)
+        try:
+            for tick, timestamp in fixed_rate_ticks(base, duration, start_at):
+                if synced:
+                    report_started()
+                    synced = False
+                for entry in self.entries:
+                    probe, interval, sink, last = entry
+                    slot = tick if base == 0 else int(tick * base / interval + 1e-9)
+                    if slot == last:
+                        continue
+                    values = probe.sample()
+                    if last is not None or not probe.needs_baseline:
+                        sink.write(tick, timestamp, values)
+                    entry[3] = slot
+        except KeyboardInterrupt:
+            print("Interrupted. Exiting.")
+        finally:
+            for probe, _, sink, _ in self.entries:
+                probe.close()
+                sink.close()
+
+def add_logger_arguments(parser):
+    """Add the options every logger shares to an argparse parser: --start-at, adaptive sampling and --stream."""
+    add_start_argument(parser)
+    add_adaptive_arguments(parser)
+    parser.add_argument('--stream',
+                      help='Also publish samples live on unix:<path> or tcp:[host:]port (see stream.py)')
+
+def output_path(probe, fmt, prefix=None, log=None):
+    """Output file of a probe, <prefix>_<probe>.<format>.
+
+    With an energy log instead of a prefix, the energy probe writes the log
+    itself and the other probes its side files, e.g. energy_<id>.freq.csv
+    (see paths.side_path()).
+    """
+    if log is None:
+        return f'{prefix}_{probe.name}.{fmt}'
+    return log if probe.name == 'energy' else side_path(log, probe.name, fmt)
+
+def run_probe(probe, interval, filename, duration, fmt='csv', start_at=None, stream=None, adaptive=None):
+    """Run a single probe writing one output file, as the standalone loggers do.
+
+    With a stream address (see stream.parse_address) every sample is also
+    published live to connected clients, at the full rate even when the
+    file is written adaptively.
+    """
+    sink = open_sink(filename, probe, fmt, adaptive=adaptive, interval=interval)
+    publisher = StreamPublisher(stream) if stream else None
+    if publisher:
+        sink = TeeSink([sink, StreamSink(publisher, probe.name, probe.columns)])
+    collector = Collector()
+    collector.add(probe, interval, sink)
+    try:
+        collector.run(duration, start_at=start_at)
+    finally:
+        if publisher:
+            publisher.close()
+
+def main():
+    parser = argparse.ArgumentParser(prog='telemetry')
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument('-f', '--prefix', help='Output file prefix, one <prefix>_<probe>.<format> per probe')
+    output.add_argument('--log', help='Energy log to write; the other probes write its side files, '
+                                      'e.g. energy_<id>.freq.csv')
+    parser.add_argument('--format', choices=['csv', 'bin'], default='csv', help='Output file format')
+    parser.add_argument('-d', '--duration', type=float, required=True, help='Duration in seconds')
+    parser.add_argument('-p', '--pin-core', type=int, help='Core to pin the collector to')
+    parser.add_argument('--energy-interval', type=float, help='Energy sampling interval in seconds')
+    parser.add_argument('--numsockets', type=int, help='Number of sockets to log energy for')
+    parser.add_argument('--subzones', action=argparse.BooleanOptionalAction, default=False,
+                      help='Also log RAPL subzones (core, uncore, dram)')
+    parser.add_argument('--freq-interval', type=float, help='Core frequency sampling interval in seconds')
+    parser.add_argument('--freq-cores', default='', help='Comma-separated list of cores for frequency')
+    parser.add_argument('--freq-backend', choices=['aperf', 'scaling', 'cpupower'], default='aperf')
+    parser.add_argument('--base-freq', type=float, help='Base frequency in MHz (default: from MSR_PLATFORM_INFO)')
+    parser.add_argument('--uncore-interval', type=float, help='Uncore frequency sampling interval in seconds')
+    parser.add_argument('--util-interval', type=float, help='Utilization sampling interval in seconds')
+    parser.add_argument('--util-cores', default='', help='Comma-separated list of cores for utilization')
+    parser.add_argument('--breakdown', action='store_true', help='Log user/system/irq/idle utilization')
+    add_logger_arguments(parser)
+    parser.add_argument('--powercap-root', default=POWERCAP_ROOT, help='Root of the powercap sysfs tree')
+    parser.add_argument('--msr-root', default=MSR_DEV_ROOT, help='Root of the msr device tree')
+    parser.add_argument('--fake-msr', action='store_true',
+                      help='Treat --msr-root as a FakeMsrBackend tree (for testing)')
+    parser.add_argument('--sysfs-root', default=SYSFS_CPU_ROOT, help='Root of the sysfs CPU tree')
+    parser.add_argument('--proc-stat', default=PROC_STAT, help='Path of /proc/stat')
+    args = parser.parse_args()
+
+    msr_backend = (FakeMsrBackend if args.fake_msr else MsrBackend)(args.msr_root)
+    probes = []
+    if args.energy_interval is not None:
+        probes.append((EnergyProbe(args.numsockets, args.subzones, args.powercap_root), args.energy_interval))
+    if args.freq_interval is not None:
+        cores = [int(x) for x in args.freq_cores.split(',')]
+        probes.append((CoreFreqProbe(cores, args.freq_backend, args.base_freq, msr_backend, args.sysfs_root),
+                       args.freq_interval))
+    if args.uncore_interval is not None:
+        probes.append((UncoreFreqProbe((), msr_backend, args.sysfs_root), args.uncore_interval))
+    if args.util_interval is not None:
+        cores = [int(x) for x in args.util_cores.split(',')]
+        probes.append((UtilizationProbe(cores, args.breakdown, args.proc_stat), args.util_interval))
+    if not probes:
+        parser.error('no probe enabled, pass at least one --*-interval')
+
+    publisher = StreamPublisher(args.stream) if args.stream else None
+    collector = Collector()
+    for probe, interval in probes:
+        filename = output_path(probe, args.format, args.prefix, args.log)
+        sink = open_sink(filename, probe, args.format, seq=True, adaptive=adaptive_options(args), interval=interval)
+        if publisher:
+            sink = TeeSink([sink, StreamSink(publisher, probe.name, probe.columns)])
+        collector.add(probe, interval, sink)
+    try:
+        collector.run(args.duration, args.pin_core, args.start_at)
+    finally:
+        if publisher:
+            publisher.close()
+
+if __name__ == "__main__":
+    main()
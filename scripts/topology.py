@@ -0,0 +1,171 @@
+import os
+import re
+import json
+import argparse
+from collections import namedtuple
+
+SYSFS_CPU_ROOT = '/sys/devices/system/cpu'
+
+# One logical CPU: its package (socket), die, physical core id within the die,
+# SMT thread index within the core and L3 cache domain
+Cpu = namedtuple('Cpu', ['cpu', 'package', 'die', 'core', 'thread', 'l3'])
+
+def parse_cpu_list(text):
+    """Parse a sysfs CPU list such as '0-3,8,10-11' into a list of ints."""
+    cpus = []
+    for part in text.strip().split(','):
+        if not part:
+            continue
+        if '-' in part:
+            lo, hi = part.split('-')
+            cpus.extend(range(int(lo), int(hi) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+def online_cpus(root=SYSFS_CPU_ROOT):
+    """Return the online CPU ids."""
+    online = os.path.join(root, 'online')
+    if os.path.exists(online):
+        with open(online) as f:
+            return parse_cpu_list(f.read())
+    return sorted(int(m.group(1)) for m in
+                  (re.fullmatch(r'cpu(\d+)', e) for e in os.listdir(root)) if m)
+
+def package_cpus(root=SYSFS_CPU_ROOT):
+    """Return a dictionary mapping physical packages (sockets) to their CPUs."""
+    packages = {}
+    for cpu in online_cpus(root):
+        with open(os.path.join(root, f'cpu{cpu}', 'topology', 'physical_package_id')) as f:
+            package = int(f.read())
+        packages.setdefault(package, []).append(cpu)
+    return packages
+
+def socket_representatives(root=SYSFS_CPU_ROOT):
+    """Return the first CPU of every socket, ordered by socket id."""
+    packages = package_cpus(root)
+    return [packages[p][0] for p in sorted(packages)]
+
+def _read_int(path, default=None):
+    try:
+        with open(path) as f:
+            return int(f.read())
+    except (FileNotFoundError, ValueError):
+        return default
+
+def _l3_domain(root, cpu):
+    """Id of the L3 cache a CPU uses, or None if sysfs does not describe one."""
+    cache = os.path.join(root, f'cpu{cpu}', 'cache')
+    if not os.path.isdir(cache):
+        return None
+    for index in sorted(os.listdir(cache)):
+        if _read_int(os.path.join(cache, index, 'level')) != 3:
+            continue
+        l3 = _read_int(os.path.join(cache, index, 'id'))
+        if l3 is None:
+            with open(os.path.join(cache, index, 'shared_cpu_list')) as f:
+                l3 = min(parse_cpu_list(f.read()))
+        return l3
+    return None
+
+def read_topology(root=SYSFS_CPU_ROOT):
+    """Return the Cpu records of all online CPUs, ordered by CPU id.
+
+    SMT threads are numbered within their physical core by CPU id, and CPUs
+    without an L3 entry get their package as L3 domain.
+    """
+    raw = []
+    for cpu in online_cpus(root):
+        topo = os.path.join(root, f'cpu{cpu}', 'topology')
+        package = _read_int(os.path.join(topo, 'physical_package_id'), 0)
+        die = _read_int(os.path.join(topo, 'die_id'), 0)
+        core = _read_int(os.path.join(topo, 'core_id'), cpu)
+        l3 = _l3_domain(root, cpu)
+        raw.append((cpu, package, die, core, package if l3 is None else l3))
+    threads = {}
+    cpus = []
+    for cpu, package, die, core, l3 in raw:
+        thread = threads.setdefault((package, die, core), 0)
+        threads[(package, die, core)] += 1
+        cpus.append(Cpu(cpu, package, die, core, thread, l3))
+    return cpus
+
+def socket_cpus(topology):
+    """Map every package to all of its CPUs, SMT siblings included."""
+    packages = {}
+    for c in topology:
+        packages.setdefault(c.package, []).append(c.cpu)
+    return packages
+
+def physical_cores(topology):
+    """Group CPUs by physical core: {(package, die, core): [Cpu, ...]} ordered by thread."""
+    cores = {}
+    for c in sorted(topology, key=lambda c: (c.package, c.die, c.core, c.thread)):
+        cores.setdefault((c.package, c.die, c.core), []).append(c)
+    return cores
+
+def _interleave(groups):
+    """Take one item of every group in turn until all are exhausted."""
+    groups = [list(g) for g in groups]
+    out = []
+    while any(groups):
+        for g in groups:
+            if g:
+                out.append(g.pop(0))
+    return out
+
+def place(topology, count, policy='spread', smt=False, sockets=None, exclude=()):
+    """Pick count CPUs to run load on.
+
+    policy 'spread' alternates between packages and, within a package,
+    between L3 domains; 'pack' fills one physical core, L3 domain and
+    package after another.  Without smt only one thread of every physical
+    core is used, so no two loads share a core; with smt the sibling threads
+    are used too, after all first threads for 'spread' and right after
+    their first thread for 'pack'.  sockets restricts the packages used and
+    exclude lists CPUs whose whole physical core is kept free, e.g. the
+    logger core from reserve_core().
+    """
+    excluded = set(exclude)
+    cores = [threads for threads in physical_cores(topology).values()
+             if (sockets is None or threads[0].package in sockets)
+             and not any(t.cpu in excluded for t in threads)]
+    if not smt:
+        cores = [threads[:1] for threads in cores]
+    if policy == 'pack':
+        order = [t for threads in sorted(cores, key=lambda ts: (ts[0].package, ts[0].l3, ts[0].die, ts[0].core))
+                 for t in threads]
+    elif policy == 'spread':
+        by_package = {}
+        for threads in cores:
+            by_package.setdefault(threads[0].package, {}).setdefault(threads[0].l3, []).append(threads)
+        # Interleave L3 domains within each package, then packages
+        per_package = [_interleave(domains[l3] for l3 in sorted(domains))
+                       for _, domains in sorted(by_package.items())]
+        ordered_cores = _interleave(per_package)
+        depth = max((len(ts) for ts in ordered_cores), default=0)
+        order = [ts[i] for i in range(depth) for ts in ordered_cores if i < len(ts)]
+    else:
+        raise ValueError(f'Unknown placement policy {policy}')
+    if count > len(order):
+        raise ValueError(f'Asked for {count} CPUs but only {len(order)} are available')
+    return [c.cpu for c in order[:count]]
+
+def reserve_core(topology, package):
+    """CPU to pin loggers to on a package: the first thread of its last physical core.
+
+    Pass it to place(exclude=...) so that no load shares its physical core.
+    """
+    threads = [ts for ts in physical_cores(topology).values() if ts[0].package == package]
+    if not threads:
+        raise ValueError(f'No CPUs on package {package}')
+    return threads[-1][0].cpu
+
+def main():
+    parser = argparse.ArgumentParser(prog='topology', description='Print the CPU topology as JSON')
+    parser.add_argument('--sysfs-root', default=SYSFS_CPU_ROOT, help='Root of the sysfs CPU tree')
+    args = parser.parse_args()
+    print(json.dumps([c._asdict() for c in read_topology(args.sysfs_root)]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import json
+import time
+import argparse
+import itertools
+import threading
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+class Tracer:
+    """Records timed spans of the experiment orchestration as a Chrome trace.
+
+    A span covers one orchestration step (setting frequencies, running an
+    experiment, fetching its files) or one remote command, with the node it
+    ran on and arguments such as the command, its exit status and the bytes
+    transferred.  Spans nest per thread; spans opened on a thread with none
+    open become children of the innermost open span of the thread that
+    created the tracer, so the sweep workers' spans hang under the sweep.
+    Open the file written by write() in chrome://tracing or Perfetto, or
+    summarize it with summarize().
+    """
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.wall_start = time.time()
+        self.spans = []
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.local = threading.local()
+        self.local.stack = self.main_stack = []
+
+    @contextmanager
+    def span(self, name, node=None, **args):
+        """Time the body as a span; the yielded dict takes arguments only known at its end."""
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        stack = self.local.stack
+        parent = stack[-1] if stack else next(iter(self.main_stack[-1:]), None)
+        span = {'id': next(self.ids), 'parent': parent, 'name': name, 'node': node,
+                'thread': threading.current_thread().name, 'args': dict(args)}
+        stack.append(span['id'])
+        begin = time.monotonic()
+        try:
+            yield span['args']
+        except BaseException as e:
+            span['args']['error'] = str(e) or type(e).__name__
+            raise
+        finally:
+            span['start'] = begin - self.start
+            span['end'] = time.monotonic() - self.start
+            stack.pop()
+            with self.lock:
+                self.spans.append(span)
+
+    def events(self):
+        """The spans as Chrome trace events, with one process per node and one thread per worker."""
+        with self.lock:
+            spans = sorted(self.spans, key=lambda s: s['start'])
+        pids, tids, events = {}, {}, []
+        for span in spans:
+            pid = pids.setdefault(span['node'] or 'local', len(pids) + 1)
+            tid = tids.setdefault(span['thread'], len(tids) + 1)
+            events.append({'name': span['name'], 'cat': 'remote' if 'command' in span['args'] else 'orchestration',
+                           'ph': 'X', 'ts': span['start'] * 1e6, 'dur': (span['end'] - span['start']) * 1e6,
+                           'pid': pid, 'tid': tid,
+                           'args': dict(span['args'], node=span['node'], span=span['id'], parent=span['parent'])})
+        for node, pid in pids.items():
+            events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': node}})
+            for thread, tid in tids.items():
+                events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': thread}})
+        return events
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.events(), 'displayTimeUnit': 'ms',
+                       'otherData': {'start_time': self.wall_start}}, f)
+
+def span(tracer, name, node=None, **args):
+    """tracer.span(), or a span that records nothing when tracer is None."""
+    return nullcontext({}) if tracer is None else tracer.span(name, node, **args)
+
+class TracedAgent:
+    """Proxy of a CloudLabAgent that records every call made through it as a span.
+
+    run_on_node() spans carry the command, its exit status and the bytes
+    sent (the command) and received (stdout and stderr); other methods, such
+    as install_deps(), are recorded under their name with their node
+    argument.
+    """
+
+    def __init__(self, agent, tracer):
+        self.agent = agent
+        self.tracer = tracer
+
+    def run_on_node(self, node, cmd, *args, **kwargs):
+        with self.tracer.span('run_on_node', node, command=cmd, bytes_out=len(cmd.encode())) as recorded:
+            stdout, stderr, exit_status = self.agent.run_on_node(node, cmd, *args, **kwargs)
+            recorded.update(exit_status=exit_status,
+                            bytes_in=sum(len(line.encode()) for line in stdout) + len(''.join(stderr or '').encode()))
+        return stdout, stderr, exit_status
+
+    def __getattr__(self, name):
+        attr = getattr(self.agent, name)
+        if not callable(attr):
+            return attr
+        def traced(*args, **kwargs):
+            node = args[0] if args and isinstance(args[0], str) else None
+            with self.tracer.span(name, node):
+                return attr(*args, **kwargs)
+        return traced
+
+def load_spans(path):
+    """Spans of a trace written by Tracer.write(), with start and end in seconds."""
+    with open(path) as f:
+        events = json.load(f)['traceEvents']
+    return [{'id': e['args']['span'], 'parent': e['args']['parent'], 'name': e['name'], 'node': e['args']['node'],
+             'start': e['ts'] / 1e6, 'end': (e['ts'] + e['dur']) / 1e6, 'args': e['args']}
+            for e in events if e['ph'] == 'X']
+
+def _covered(intervals):
+    """Total length of the union of (start, end) intervals."""
+    total, reach = 0.0, float('-inf')
+    for start, end in sorted(intervals):
+        if end > reach:
+            total += end - max(start, reach)
+            reach = end
+    return total
+
+def critical_path(spans):
+    """The chain of steps that determined the end-to-end time, as (name, node, seconds) in time order.
+
+    Walks back from the end of the trace: within a span, the child that
+    ended last is on the path, then the child that ended last before that
+    one started, and so on, descending into every child on the path.  Time
+    of a span not covered by its children on the path counts as that span's
+    own step.
+    """
+    children = defaultdict(list)
+    ids = {s['id'] for s in spans}
+    for s in spans:
+        children[s['parent'] if s['parent'] in ids else None].append(s)
+
+    def walk(span_id, name, node, start, end):
+        path, t = [], end
+        for child in sorted(children[span_id], key=lambda s: s['end'], reverse=True):
+            if child['end'] <= t + 1e-9:
+                path = walk(child['id'], child['name'], child['node'], child['start'], child['end']) + path
+                t = child['start']
+        own = (end - start) - sum(seconds for _, _, seconds in path)
+        if name is not None and own > 1e-6:
+            path.insert(0, (name, node, own))
+        return path
+
+    if not spans:
+        return []
+    return walk(None, None, None, min(s['start'] for s in spans), max(s['end'] for s in spans))
+
+def node_time(spans):
+    """Busy, cooldown and idle seconds of every node over the whole trace.
+
+    A node is busy while any span other than a sweep cooldown runs on it and
+    idle while none does.
+    """
+    start, end = min(s['start'] for s in spans), max(s['end'] for s in spans)
+    nodes = {}
+    for node in sorted({s['node'] for s in spans if s['node']}):
+        own = [(s['start'], s['end'], s['name']) for s in spans if s['node'] == node]
+        busy = _covered([(a, b) for a, b, name in own if name != 'cooldown'])
+        cooldown = _covered([(a, b) for a, b, name in own if name == 'cooldown'])
+        idle = (end - start) - _covered([(a, b) for a, b, _ in own])
+        nodes[node] = {'busy': busy, 'cooldown': cooldown, 'idle': idle, 'idle_share': idle / max(end - start, 1e-9)}
+    return nodes
+
+def summarize(spans):
+    """Text report of a trace: time per step, the critical path and per-node idle time."""
+    if not spans:
+        return 'Empty trace'
+    total = max(s['end'] for s in spans) - min(s['start'] for s in spans)
+    lines = [f'Total: {total:.1f} s', '', 'Time per step (all spans, overlapping):']
+    steps = defaultdict(lambda: [0, 0.0])
+    for s in spans:
+        steps[s['name']][0] += 1
+        steps[s['name']][1] += s['end'] - s['start']
+    for name, (count, seconds) in sorted(steps.items(), key=lambda item: -item[1][1]):
+        lines.append(f'  {name:>24}: {seconds:9.1f} s in {count} spans')
+
+    path = critical_path(spans)
+    lines += ['', f'Critical path ({len(path)} steps):']
+    on_path = defaultdict(float)
+    for name, _, seconds in path:
+        on_path[name] += seconds
+    for name, seconds in sorted(on_path.items(), key=lambda item: -item[1]):
+        lines.append(f'  {name:>24}: {seconds:9.1f} s ({100 * seconds / max(total, 1e-9):5.1f}%)')
+
+    lines += ['', 'Per node:']
+    for node, t in node_time(spans).items():
+        lines.append(f"  {node:>24}: busy {t['busy']:.1f} s, cooldown {t['cooldown']:.1f} s, "
+                     f"idle {t['idle']:.1f} s ({100 * t['idle_share']:.1f}%)")
+    return '\n'.join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(prog='tracing', description='Summarize an orchestration trace')
+    parser.add_argument('trace', help='Trace written by power_experiment.py --trace')
+    args = parser.parse_args()
+    print(summarize(load_spans(args.trace)))
+
+if __name__ == '__main__':
+    main()
@@ -1,43 +1,30 @@
-import csv
-import time
 import argparse
-import subprocess
-
-def get_uncore_freq():
-    """Read current uncore frequency"""
-    command = f"sudo rdmsr 0x621"
-    result = subprocess.check_output(command, shell=True)
-    hex_value = result.decode().strip()
-    # Convert hex to decimal and multiply by 100
-    return int(hex_value, 16) * 100
-
-
+from msr import MSR_DEV_ROOT, FakeMsrBackend, MsrBackend
+from adaptive import adaptive_options
+from telemetry import UncoreFreqProbe, add_logger_arguments, run_probe
+from topology import SYSFS_CPU_ROOT
 
 def main():
-    parser = argparse.ArgumentParser(prog='freq_logger')
+    parser = argparse.ArgumentParser(prog='uncore_freq_logger')
     parser.add_argument('-f', '--filename', help='Output CSV file path')    
-    parser.add_argument('-d', '--duration', type=int, help='Duration in seconds') 
+    parser.add_argument('-d', '--duration', type=float, help='Duration in seconds') 
+    parser.add_argument('-i', '--interval', type=float, default=0.1, help='Sampling interval in seconds')
+    parser.add_argument('-r', '--extra-msrs', default='',
+                      help='Comma-separated list of extra MSRs to log, e.g. 0xE7,0xE8')
+    parser.add_argument('--msr-root', default=MSR_DEV_ROOT, help='Root of the msr device tree')
+    parser.add_argument('--fake-msr', action='store_true',
+                      help='Treat --msr-root as a FakeMsrBackend tree (for testing)')
+    parser.add_argument('--sysfs-root', default=SYSFS_CPU_ROOT, help='Root of the sysfs CPU tree')
+    parser.add_argument('--format', choices=['csv', 'bin'], default='csv',
+                      help='Output file format (bin: see binlog.py)')
+    add_logger_arguments(parser)
     args = parser.parse_args()
 
-    
-    with open(args.filename, 'w', newline='') as csvfile:
-        csv_writer = csv.writer(csvfile)
-        
-        # Write header with core numbers
-        header = ['timestamp', 'uncore_freq']
-        csv_writer.writerow(header)
-
-        start_time = time.time()
-        try:
-            while time.time() - start_time < args.duration:
-                timestamp = time.time()
-                row = [timestamp, get_uncore_freq()]
-                csv_writer.writerow(row)
-                # csvfile.flush()
-                # time.sleep(args.interval)
-
-        except KeyboardInterrupt:
-            print("Interrupted. Exiting.")
+    extra_msrs = [int(x, 16) for x in args.extra_msrs.split(',') if x]
+    msr_backend = (FakeMsrBackend if args.fake_msr else MsrBackend)(args.msr_root)
+    probe = UncoreFreqProbe(extra_msrs, msr_backend, args.sysfs_root)
+    run_probe(probe, args.interval, args.filename, args.duration, args.format, args.start_at, args.stream,
+              adaptive_options(args))
 
 if __name__ == "__main__":
     main() 
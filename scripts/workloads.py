@@ -0,0 +1,106 @@
+import array
+import functools
+import numpy as np
+
+class Loop:
+    """The original busy loop: an empty Python loop. Work is loop iterations."""
+
+    unit = 'iterations'
+
+    def __init__(self, chunk=1000):
+        self.chunk = chunk
+
+    def step(self):
+        for _ in range(self.chunk):
+            continue
+        return self.chunk
+
+class Spin:
+    """Integer ALU spin: a linear congruential generator. Work is LCG updates."""
+
+    unit = 'ops'
+
+    def __init__(self, chunk=1000):
+        self.chunk = chunk
+        self.x = 1
+
+    def step(self):
+        x = self.x
+        for _ in range(self.chunk):
+            x = (x * 1103515245 + 12345) & 0xFFFFFFFF
+        self.x = x
+        return self.chunk
+
+class Fma:
+    """Vectorized multiply-add over cache-resident float64 arrays. Work is flops.
+
+    The four arrays (a, b, c and the product) take 32 bytes per element:
+    the default of 512 elements (16 KiB) stays in a 32 KiB L1d, and 8192
+    elements (256 KiB), the fma_l2 kernel, stay in L2.
+    """
+
+    unit = 'flops'
+
+    def __init__(self, elements=512, repeat=16):
+        self.a = np.random.rand(elements)
+        self.b = np.random.rand(elements)
+        self.c = np.zeros(elements)
+        self.tmp = np.empty(elements)
+        self.repeat = repeat
+
+    def step(self):
+        for _ in range(self.repeat):
+            np.multiply(self.a, self.b, out=self.tmp)
+            np.add(self.c, self.tmp, out=self.c)
+        return 2 * len(self.a) * self.repeat
+
+class Stream:
+    """Streaming copy through a buffer much larger than the LLC. Work is bytes read plus written."""
+
+    unit = 'bytes'
+
+    def __init__(self, size=256 << 20, chunk=1 << 20):
+        words = size // 8 // 2
+        self.src = np.ones(words)
+        self.dst = np.empty(words)
+        self.chunk = chunk // 8
+        self.offset = 0
+
+    def step(self):
+        end = min(self.offset + self.chunk, len(self.src))
+        np.copyto(self.dst[self.offset:end], self.src[self.offset:end])
+        done = (end - self.offset) * 8 * 2
+        self.offset = 0 if end == len(self.src) else end
+        return done
+
+class Chase:
+    """Latency-bound pointer chasing around one random cycle through a large array. Work is loads."""
+
+    unit = 'loads'
+
+    def __init__(self, size=64 << 20, chunk=1000):
+        entries = size // 8
+        order = np.random.permutation(entries)
+        self.next = np.empty(entries, dtype=np.int64)
+        self.next[order[:-1]] = order[1:]
+        self.next[order[-1]] = order[0]
+        # array.array indexing returns plain ints without NumPy scalar overhead
+        self.next = array.array('q', self.next.tobytes())
+        self.chunk = chunk
+        self.i = 0
+
+    def step(self):
+        nxt, i = self.next, self.i
+        for _ in range(self.chunk):
+            i = nxt[i]
+        self.i = i
+        return self.chunk
+
+KERNELS = {
+    'loop': Loop,
+    'spin': Spin,
+    'fma': Fma,
+    'fma_l2': functools.partial(Fma, 8192),
+    'stream': Stream,
+    'chase': Chase,
+}
@@ -0,0 +1,41 @@
+import numpy as np
+from adaptive import AdaptiveSink, expand_levels
+
+class ListSink:
+    def __init__(self):
+        self.rows = []
+
+    def write(self, seq, timestamp, values):
+        self.rows.append((seq, timestamp, values))
+
+    def close(self):
+        pass
+
+def test_adaptive_sink_keeps_counters_exact_and_levels_rebuildable():
+    interval = 0.01
+    timestamps = 1000 + np.arange(3000) * interval
+    # A frequency that steps between levels and a counter whose rate follows it
+    level = np.where((timestamps - timestamps[0]) % 10 < 4, 1200.0, 2400.0)
+    counter = np.cumsum(level * 10)
+    sink = ListSink()
+    adaptive = AdaptiveSink(sink, ['counter', 'level'], threshold=0.01, heartbeat=1.0, pre=1, post=0)
+    for seq, (t, c, l) in enumerate(zip(timestamps, counter, level)):
+        adaptive.write(seq, t, [c, l])
+    adaptive.close()
+
+    seqs = np.array([seq for seq, _, _ in sink.rows])
+    rows = np.array([values for _, _, values in sink.rows])
+    assert len(rows) < len(timestamps) / 5
+    assert rows[:, 2].sum() == len(timestamps)
+    assert seqs[-1] == len(timestamps) - 1
+    # Counters are exact at every emitted row, so energy between rows is too
+    np.testing.assert_array_equal(rows[:, 0], counter[seqs])
+    assert np.diff(timestamps[seqs]).max() <= 1.0 + interval
+
+    rebuilt = expand_levels(timestamps[seqs], rows[:, [1]], timestamps)[:, 0]
+    np.testing.assert_allclose(rebuilt, level, rtol=0.01)
+
+def test_expand_levels_before_the_first_row_is_nan():
+    rebuilt = expand_levels(np.array([1.0, 2.0]), np.array([[10.0], [20.0]]), np.array([0.5, 1.0, 1.5, 2.5]))
+    np.testing.assert_array_equal(rebuilt[1:, 0], [10.0, 10.0, 20.0])
+    assert np.isnan(rebuilt[0, 0])
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+from aggregate import BinnedStats
+
+@pytest.mark.filterwarnings('ignore:Degrees of freedom')
+@pytest.mark.parametrize('method', ['bin', 'interp'])
+def test_binned_stats_match_numpy(method):
+    rng = np.random.default_rng(1)
+    width = 0.5
+    runs = []
+    for length in (40, 55, 48, 60):
+        # One sample in the middle of every bin, so both methods see the sample itself
+        times = (np.arange(length) + 0.5) * width
+        values = rng.normal(50, 5, (length, 2))
+        values[rng.random(length) < 0.1, 1] = np.nan
+        runs.append((times, values))
+    stats = BinnedStats(width, 2)
+    for times, values in runs:
+        stats.add_run(times, values, method)
+
+    grid = np.full((len(runs), 60, 2), np.nan)
+    for i, (_, values) in enumerate(runs):
+        grid[i, :len(values)] = values
+    if method == 'interp':
+        # Interpolation fills a missing sample between its neighbours
+        for i, (times, values) in enumerate(runs):
+            valid = ~np.isnan(values[:, 1])
+            inside = (times >= times[valid][0]) & (times <= times[valid][-1])
+            grid[i, :len(values), 1][inside] = np.interp(times[inside], times[valid], values[valid, 1])
+    np.testing.assert_array_equal(stats.n, (~np.isnan(grid)).sum(axis=0))
+    present = stats.n > 0
+    np.testing.assert_allclose(stats.mean[present], np.nanmean(grid, axis=0)[present])
+    several = stats.n > 1
+    np.testing.assert_allclose(stats.std(ddof=1)[several], np.nanstd(grid, axis=0, ddof=1)[several])
+    np.testing.assert_allclose(stats.times(), np.arange(60) * width)
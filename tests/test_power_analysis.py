@@ -0,0 +1,63 @@
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from paths import meta_path
+from power_analysis import CounterDeltas, counter_power, windowed_power
+
+# max_energy_range_uj of a package and a DRAM zone as sysfs reports them
+RANGES = np.array([262143328850.0, 65712999613.0])
+
+def counters(seed=0, samples=2000, start=None):
+    """Sample times, the true energy per interval in microjoules and the wrapping counters of two zones."""
+    rng = np.random.default_rng(seed)
+    timestamps = 1000 + np.cumsum(rng.uniform(0.005, 0.015, samples))
+    used = rng.uniform(0.5e6, 2e6, (samples, 2))
+    used[0] = 0
+    start = RANGES - 5e8 if start is None else start
+    return timestamps, used, np.mod(start + np.cumsum(used, axis=0), RANGES)
+
+def test_counter_power_is_exact_across_a_wrap():
+    timestamps, used, energy = counters()
+    assert (np.diff(energy, axis=0) < 0).any(axis=0).all()
+    power = counter_power(timestamps, energy, RANGES)
+    assert np.isnan(power[0]).all()
+    np.testing.assert_allclose(power[1:], used[1:] / np.diff(timestamps)[:, None] / 1e6, rtol=1e-9)
+
+def test_counter_power_stacks_runs():
+    runs = [counters(seed) for seed in range(3)]
+    stacked = counter_power(np.stack([t for t, _, _ in runs]), np.stack([e for _, _, e in runs]), RANGES)
+    for i, (timestamps, _, energy) in enumerate(runs):
+        np.testing.assert_array_equal(stacked[i], counter_power(timestamps, energy, RANGES))
+
+@pytest.mark.parametrize('chunk', [1, 7, 500])
+def test_counter_deltas_match_one_pass(chunk):
+    timestamps, used, energy = counters()
+    deltas = CounterDeltas(RANGES)
+    parts = [deltas.update(timestamps[i:i + chunk], energy[i:i + chunk]) for i in range(0, len(timestamps), chunk)]
+    times, dt, joules = (np.concatenate(p) for p in zip(*parts))
+    np.testing.assert_array_equal(times, timestamps[1:])
+    np.testing.assert_allclose(dt, np.diff(timestamps))
+    np.testing.assert_allclose(joules, used[1:] / 1e6, rtol=1e-9)
+
+def write_log(path, timestamps, energy):
+    zones = ['energy_zone_0', 'energy_zone_0_0']
+    df = pd.DataFrame({'timestamp': timestamps})
+    for i, zone in enumerate(zones):
+        df[zone] = energy[:, i].astype(np.int64)
+    df.to_csv(path, index=False)
+    with open(meta_path(path), 'w') as f:
+        json.dump({'zones': {zone: {'max_energy_range_uj': float(r)} for zone, r in zip(zones, RANGES)}}, f)
+
+def test_windowed_power_does_not_depend_on_chunk_size(tmp_path):
+    timestamps, used, energy = counters(start=RANGES - 5e8)
+    energy = np.floor(energy)
+    path = str(tmp_path / 'energy.csv')
+    write_log(path, timestamps, energy)
+    reference = pd.DataFrame(windowed_power(path, 1.0, chunk_size=len(timestamps)))
+    for chunk in (1, 3, 64, 999):
+        pd.testing.assert_frame_equal(pd.DataFrame(windowed_power(path, 1.0, chunk_size=chunk)), reference,
+                                      check_exact=False, rtol=1e-12)
+    total = np.mod(energy[-1] - energy[0], RANGES) / 1e6
+    np.testing.assert_allclose(reference[['power_zone_0_joules', 'power_zone_0_0_joules']].iloc[-1], total)
+    assert reference['samples'].sum() == len(timestamps) - 1